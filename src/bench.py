@@ -0,0 +1,204 @@
+import argparse
+import difflib
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+import pandas as pd
+from openpyxl import load_workbook
+
+import export_pdf
+import main as pipeline_main
+from pipeline import PipelineContext, get_next_saturday
+
+# File names the stages recognize (see discover.FILE_PATTERNS)
+CONTRACT_PREFIXES = {
+    "legumes": "feuille-distribution-contrat-legumes-2025",
+    "oeufs": "feuille-distribution-contrat-oeufs-2024-2025",
+}
+
+# Sample group names, extra groups are called "groupe<N>"
+GROUP_NAMES = ["cscb", "four", "mjc", "autre"]
+
+
+# --- Synthetic workbooks, shaped like the contract exports
+
+def group_names(n_groups: int) -> list:
+    return [GROUP_NAMES[i] if i < len(GROUP_NAMES) else f"groupe{i}" for i in range(n_groups)]
+
+
+def static_lines(kind: str, saturday: date, columns: list, n_lines: int) -> list:
+    # Title, date, price/"vrac" lines, then the "Cumul" line right above the header
+    width = 2 + len(columns)
+    lines = [[f"Feuille de distribution {kind}"] + [None] * (width - 1),
+             [f"Samedi {saturday}"] + [None] * (width - 1)]
+    for i in range(max(n_lines - 3, 0)):
+        if i % 2 == 0:
+            lines.append([None, "Prix"] + [f"{random.randint(1, 9)}-{random.randint(10, 99)}" for _ in columns])
+        else:
+            lines.append([None, "Vrac"] + ["vrac"] * len(columns))
+    lines.append(["Cumul", None] + [random.randint(1, 9) for _ in columns])
+    return lines
+
+
+def write_contract(path: Path, kind: str, group: str, columns: list, saturdays: list,
+                   n_members: int, n_static: int):
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        for saturday in saturdays:
+            rows = static_lines(kind, saturday, columns, n_static)
+            rows.append(["Nom", "Prénom"] + columns)
+            for m in range(n_members):
+                rows.append([f"Nom{group}{m}", f"Prenom{m}"]
+                            + [random.choice([1, None, 1, 2]) for _ in columns])
+            rows.append(["Cumul", None] + [random.randint(1, 9) for _ in columns])
+            sheet = saturday.strftime("%Y-%m-%d")
+            pd.DataFrame(rows).to_excel(writer, sheet_name=sheet, index=False, header=False)
+
+
+def generate_inputs(folder: Path, n_groups: int = 4, n_members: int = 20, n_weeks: int = 6,
+                    n_static: int = 5, first_saturday: date = None, seed: int = 1) -> list:
+    # Writes the legumes/oeufs group workbooks and Distribution_AMAP files; returns the Saturdays
+    random.seed(seed)
+    folder.mkdir(parents=True, exist_ok=True)
+    first_saturday = first_saturday or get_next_saturday()
+    saturdays = [first_saturday + timedelta(weeks=i) for i in range(n_weeks)]
+    groups = group_names(n_groups)
+
+    for group in groups:
+        write_contract(folder / f"{CONTRACT_PREFIXES['legumes']}-{group}.xlsx", "legumes", group,
+                       ["legumes", "legumes"], saturdays, n_members, n_static)
+        write_contract(folder / f"{CONTRACT_PREFIXES['oeufs']}-{group}.xlsx", "oeufs", group,
+                       ["oeufs"], saturdays, n_members, n_static)
+
+    rows = [
+        {"Date": pd.Timestamp(saturday), "Tâche": f"Distribution légumes {group}",
+         "Nom": f"Benevole{group}{k}", "Prénom": "X"}
+        for saturday in saturdays for group in groups for k in range(3)
+    ]
+    pd.DataFrame(rows).to_excel(folder / "Distribution_AMAP_bench.xlsx", index=False)
+
+    # An older roster without the benchmarked Saturdays, with undated note lines:
+    # none of its rows may reach the output
+    notes = [
+        {"Date": pd.Timestamp(first_saturday - timedelta(weeks=k)), "Tâche": f"Distribution légumes {groups[0]}",
+         "Nom": f"Ancien{k}", "Prénom": "X"}
+        for k in (1, 2)
+    ] + [{"Date": "à définir", "Tâche": f"Note {k}", "Nom": None, "Prénom": None} for k in (1, 2)]
+    pd.DataFrame(notes).to_excel(folder / "Distribution_AMAP_notes.xlsx", index=False)
+    return saturdays
+
+
+# --- Golden reference
+
+def dump_workbook(path: Path) -> list:
+    # Cell values of every sheet, plus the border/fill of each row
+    wb = load_workbook(path)
+    lines = []
+    for ws in wb.worksheets:
+        lines.append(f"## {ws.title} ({ws.max_row}x{ws.max_column})")
+        for row in ws.iter_rows():
+            first = row[0]
+            style = ("B" if first.border.left.style else "-") + ("F" if first.fill.fill_type else "-")
+            lines.append(style + " | " + "\t".join("" if c.value is None else str(c.value) for c in row))
+    return lines
+
+
+def compare_golden(lines: list, params: dict, golden: Path, update: bool) -> bool:
+    reference = {"params": params, "lines": lines}
+    if update or not golden.exists():
+        golden.write_text(json.dumps(reference, ensure_ascii=False, indent=1), encoding="utf-8")
+        print(f"✅ Golden reference written: {golden}")
+        return True
+
+    expected = json.loads(golden.read_text(encoding="utf-8"))
+    if expected["params"] != params:
+        print(f"⚠️ Golden reference built with other parameters: {expected['params']}")
+        return False
+    if expected["lines"] == lines:
+        print("✅ Output identical to the golden reference")
+        return True
+    print("❌ Output differs from the golden reference:")
+    diff = difflib.unified_diff(expected["lines"], lines, "golden", "current", lineterm="", n=1)
+    for line in list(diff)[:40]:
+        print("   " + line)
+    return False
+
+
+# --- Timing
+
+def timed(timings: dict, name: str, func, *args):
+    start = time.perf_counter()
+    try:
+        func(*args)
+    except Exception as e:
+        timings[name] = None
+        print(f"⚠️ {name} failed: {e}")
+        return
+    timings[name] = time.perf_counter() - start
+
+
+def run_once(folder: Path, saturday: date, workers: int, use_cache: bool, per_group: bool = False) -> dict:
+    context = PipelineContext(folder=folder, target_date=saturday, workers=workers, use_cache=use_cache,
+                              pdf_per_group=per_group)
+    timings = {}
+    for _, name, stage in pipeline_main.EXTRACTION_STAGES:
+        timed(timings, name, stage.run, context)
+    timed(timings, "combine_outputs", pipeline_main.combine_outputs, context)
+
+    # The documents the pipeline writes, per-group cumul lines included
+    timed(timings, "generate_pdf", export_pdf.run, context, False)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times the pipeline stages on synthetic workbooks")
+    parser.add_argument("--groups", type=int, default=4)
+    parser.add_argument("--members", type=int, default=20, help="members per group")
+    parser.add_argument("--weeks", type=int, default=6, help="weekly sheets per workbook")
+    parser.add_argument("--static-lines", type=int, default=5, help="lines above the 'Nom' header")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs (the best one is kept)")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--pdf-per-group", action="store_true", help="also time the per-group pdfs")
+    parser.add_argument("--cache", action="store_true", help="use the parse cache (cold on the first run)")
+    parser.add_argument("--dir", type=Path, help="where the inputs are generated (default: a temp folder)")
+    parser.add_argument("--golden", type=Path, help="reference dump of the output workbook, written if missing")
+    parser.add_argument("--update-golden", action="store_true")
+    args = parser.parse_args()
+
+    params = {"groups": args.groups, "members": args.members, "weeks": args.weeks,
+              "static_lines": args.static_lines, "seed": args.seed}
+    golden = args.golden.resolve() if args.golden else None
+    folder = (args.dir or Path(tempfile.mkdtemp(prefix="amap_bench_"))).resolve()
+
+    start = time.perf_counter()
+    first_saturday = date(2026, 10, 3)  # fixed so the golden reference does not depend on today
+    saturdays = generate_inputs(folder, args.groups, args.members, args.weeks, args.static_lines,
+                                first_saturday, args.seed)
+    print(f"Inputs generated in {folder} ({time.perf_counter() - start:.2f}s)")
+
+    # Run from the bench folder, as launch.sh runs from the input folder
+    os.chdir(folder)
+    saturday = saturdays[len(saturdays) // 2]
+    runs = [run_once(folder, saturday, args.workers, args.cache, args.pdf_per_group) for _ in range(args.repeat)]
+
+    print(f"\nStage timings over {args.repeat} run(s), best / mean (s):")
+    for stage in runs[0]:
+        values = [r[stage] for r in runs if r.get(stage) is not None]
+        if not values:
+            print(f"  {stage:<22} failed")
+            continue
+        print(f"  {stage:<22} {min(values):8.3f} {sum(values) / len(values):8.3f}")
+
+    if golden is not None:
+        output = folder / f"distrib_amap_{saturday:%Y-%m-%d}.xlsx"
+        if not compare_golden(dump_workbook(output), params, golden, args.update_golden):
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
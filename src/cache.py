@@ -0,0 +1,104 @@
+import hashlib
+import os
+import threading
+import pandas as pd
+from pathlib import Path
+
+CACHE_DIR = ".amap_cache"
+# Oldest entries are evicted once the cache grows past this size
+MAX_CACHE_BYTES = 200 * 1024 * 1024
+# Bump when the reading/cleaning code changes so stale entries are ignored
+CACHE_VERSION = 3
+
+
+def file_digest(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# On-disk cache of parsed workbooks, keyed by file content hash + sheet name
+class ParseCache:
+    def __init__(self, folder: Path, max_bytes: int = MAX_CACHE_BYTES):
+        self.dir = Path(folder) / CACHE_DIR
+        self.max_bytes = max_bytes
+
+    def key(self, path: Path, *parts) -> str:
+        h = hashlib.sha256(file_digest(path).encode())
+        for part in (CACHE_VERSION, *parts):
+            h.update(f"\0{part}".encode())
+        return h.hexdigest()
+
+    def get(self, key: str):
+        entry = self.dir / f"{key}.pkl"
+        if not entry.exists():
+            return None
+        try:
+            value = pd.read_pickle(entry)
+        except Exception as e:
+            print(f"⚠️ Ignoring unreadable cache entry {entry.name}: {e}")
+            entry.unlink(missing_ok=True)
+            return None
+        os.utime(entry)  # mark as recently used
+        return value
+
+    def put(self, key: str, value):
+        self.dir.mkdir(exist_ok=True)
+        entry = self.dir / f"{key}.pkl"
+        tmp = entry.with_suffix(".tmp")
+        pd.to_pickle(value, tmp)
+        tmp.replace(entry)
+        self.evict()
+
+    def evict(self):
+        # Stages running at the same time may evict entries under our feet
+        entries = []
+        for entry in self.dir.glob("*.pkl"):
+            try:
+                entries.append((entry.stat(), entry))
+            except FileNotFoundError:
+                continue
+        entries.sort(key=lambda e: e[0].st_mtime)
+        total = sum(stat.st_size for stat, _ in entries)
+        for stat, entry in entries:
+            if total <= self.max_bytes:
+                break
+            total -= stat.st_size
+            entry.unlink(missing_ok=True)
+
+
+# In-process cache for long-running modes, keyed by path + size/mtime (no hashing).
+# Misses fall back on the on-disk cache when there is one.
+class MemoryCache:
+    def __init__(self, backing: ParseCache = None):
+        self.entries = {}
+        self.backing = backing
+        self.lock = threading.Lock()  # shared by the stages running at the same time
+
+    def key(self, path: Path, *parts) -> tuple:
+        stat = Path(path).stat()
+        return (str(path), parts, stat.st_size, stat.st_mtime_ns)
+
+    def get(self, key: tuple):
+        if key in self.entries:
+            return self.entries[key]
+        if self.backing is None:
+            return None
+        value = self.backing.get(self.backing.key(key[0], *key[1]))
+        if value is not None:
+            self.store(key, value)
+        return value
+
+    def put(self, key: tuple, value):
+        self.store(key, value)
+        if self.backing is not None:
+            self.backing.put(self.backing.key(key[0], *key[1]), value)
+
+    def store(self, key: tuple, value):
+        # A new version of a file replaces the entries of the previous one
+        with self.lock:
+            for old in [k for k in self.entries if k[:2] == key[:2]]:
+                del self.entries[old]
+            self.entries[key] = value
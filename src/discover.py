@@ -0,0 +1,95 @@
+import os
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+# Legacy .xls workbooks are read directly (through xlrd), no conversion needed
+WORKBOOK_SUFFIXES = (".xls", ".xlsx")
+
+# Contract workbooks are named <contract>-<season>-<group>.xls[x], e.g.
+# "feuille-distribution-contrat-legumes-2025-cscb (1).xlsx" -> season 2025, group cscb
+GROUP_SUFFIX = r"-(?P<group>(?i:[a-z0-9\- ]+))(?:\s\(\d+\))?"
+
+# {kind: regex matching the whole file name without extension}, one kind per stage.
+# The first matching kind wins; change the seasons here when the new contracts arrive.
+FILE_PATTERNS = {
+    "oeufs": r"feuille-distribution-contrat-oeufs-(?P<season>2024-2025)" + GROUP_SUFFIX,
+    "legumes": r"feuille-distribution-contrat-legumes-(?P<season>2025)" + GROUP_SUFFIX,
+    "permanences": r"Distribution_AMAP.*",
+}
+
+
+# One input workbook, as found by the scan
+@dataclass
+class InputFile:
+    path: Path
+    kind: str
+    size: int
+    mtime_ns: int
+    group: str = None  # contract workbooks only
+    season: str = None
+
+
+# Every input workbook of the folder, sorted by name
+@dataclass
+class FileManifest:
+    files: list
+
+    def of_kind(self, kind: str) -> list:
+        return [f for f in self.files if f.kind == kind]
+
+    def paths(self, kind: str) -> list:
+        return [f.path for f in self.of_kind(kind)]
+
+    def group_files(self, kind: str) -> list:
+        # (group, file) of every contract workbook of that kind
+        return [(f.group, f.path) for f in self.of_kind(kind) if f.group]
+
+    def signature(self) -> dict:
+        # {file: (kind, size, mtime)}, compared between two scans to spot changes
+        return {f.path: (f.kind, f.size, f.mtime_ns) for f in self.files}
+
+
+@lru_cache(maxsize=None)
+def compile_patterns(patterns: tuple) -> list:
+    # Each configuration is compiled once
+    return [(kind, re.compile(pattern)) for kind, pattern in patterns]
+
+
+def classify(stem: str, patterns: list) -> tuple:
+    # (kind, match) of the first pattern matching the file name, else (None, None)
+    for kind, pattern in patterns:
+        match = pattern.fullmatch(stem)
+        if match:
+            return kind, match
+    return None, None
+
+
+def scan(folder: Path, patterns: dict = None) -> FileManifest:
+    # Lists the folder once. When both exist, the .xls wins over the .xlsx of the same
+    # name (an old converted copy).
+    compiled = compile_patterns(tuple((patterns or FILE_PATTERNS).items()))
+    found = {}
+    with os.scandir(folder) as entries:
+        for entry in sorted(entries, key=lambda e: e.name):
+            path = Path(folder) / entry.name
+            if path.suffix.lower() not in WORKBOOK_SUFFIXES or path.stem in found:
+                continue
+            kind, match = classify(path.stem, compiled)
+            if kind is None:
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+            except FileNotFoundError:  # removed meanwhile
+                continue
+            groups = match.groupdict()
+            group = groups.get("group")
+            found[path.stem] = InputFile(
+                path, kind, stat.st_size, stat.st_mtime_ns,
+                group=group.strip().lower() if group else None,
+                season=groups.get("season"),
+            )
+    return FileManifest(sorted(found.values(), key=lambda f: f.path))
@@ -0,0 +1,61 @@
+import pandas as pd
+from pathlib import Path
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Border, NamedStyle, PatternFill, Side
+
+THIN = Side(border_style="thin", color="000000")
+BORDER = Border(left=THIN, right=THIN, top=THIN, bottom=THIN)
+GROUP_FILL = PatternFill(start_color="FFFFCC", end_color="FFFFCC", fill_type="solid")
+
+
+def add_named_styles(wb: Workbook) -> dict:
+    # The few formats used by the distribution sheets, keyed by (border, fill)
+    styles = {
+        (True, False): NamedStyle(name="amap_border", border=BORDER),
+        (True, True): NamedStyle(name="amap_group_start", border=BORDER, fill=GROUP_FILL),
+        (False, True): NamedStyle(name="amap_group_fill", fill=GROUP_FILL),
+    }
+    for style in styles.values():
+        wb.add_named_style(style)
+    return {key: style.name for key, style in styles.items()}
+
+
+def cell_value(val):
+    # Empty cells are left blank, like pandas' to_excel does
+    if val is None or (not isinstance(val, str) and pd.isna(val)) or val == "":
+        return None
+    return val
+
+
+def write_sheets(path: Path, sheets: dict):
+    # Streams {sheet title: SheetOutput} row by row into a write-only workbook
+    wb = Workbook(write_only=True)
+    style_names = add_named_styles(wb)
+
+    for title, sheet in sheets.items():
+        ws = wb.create_sheet(title)
+
+        if sheet.header and len(sheet.df.columns):
+            ws.append([cell_value(col) for col in sheet.df.columns])
+
+        rows = sheet.df.astype(object).itertuples(index=False, name=None)
+        styles = sheet.row_styles
+        if styles is None:
+            for row in rows:
+                ws.append([cell_value(v) for v in row])
+            continue
+
+        for row, has_border, has_fill in zip(rows, styles["border"], styles["fill"]):
+            style = style_names.get((bool(has_border), bool(has_fill)))
+            if style is None:
+                ws.append([cell_value(v) for v in row])
+                continue
+            cells = []
+            for v in row:
+                cell = WriteOnlyCell(ws, value=cell_value(v))
+                cell.style = style
+                cells.append(cell)
+            ws.append(cells)
+
+    wb.save(path)
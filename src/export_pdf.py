@@ -1,129 +1,240 @@
+import multiprocessing
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import numpy as np
 import pandas as pd
 from jinja2 import Template
-import pdfkit
 from pathlib import Path
-from datetime import datetime, timedelta
 
-HTML_TEMPLATE = """
+import pdf_render
+from instrument import RunReport, Span, measure
+from pipeline import PipelineContext
+
+try:
+    import pdfkit
+except ImportError:  # only needed by the "pdfkit" renderer
+    pdfkit = None
+
+WKHTMLTOPDF_PATH = r"C:/Program Files/wkhtmltopdf/bin/wkhtmltopdf.exe"
+
+# 📄 Display names for sheets
+SHEET_TITLES = {
+    "legumes_merged": "Légumes",
+    "oeufs_merged": "Œufs"
+}
+
+# Whole document, compiled once; the rows are pulled from generators while rendering
+HTML_TEMPLATE = """<!DOCTYPE html>
 <html>
 <head>
-  <meta charset="utf-8">
-<style>
+  <meta charset="UTF-8">
+  <style>
     table {
         border-collapse: collapse;
         width: 100%;
         font-family: Arial, sans-serif;
+        font-size: 12px;
     }
     td, th {
-        border: none;
         padding: 4px;
         text-align: left;
     }
-</style>
+    tr.name-row td {
+        border: 1px solid #000;
+    }
+    tr.other-row td {
+        border: none;
+    }
+  </style>
 </head>
 <body>
-  {% for title, table_html in tables %}
-    <h2>{{ title }}</h2>
-    {{ table_html|safe }}
-  {% endfor %}
+{% for title, rows in tables %}
+{% if not loop.first %}
+<div style="page-break-before: always;"></div>
+{% endif %}
+<h2>{{ title }}</h2>
+<table>
+{% for cells, row_class in rows %}
+<tr class="{{ row_class }}">{% for value in cells %}<td>{{ value }}</td>{% endfor %}</tr>
+{% endfor %}
+</table>
+{% endfor %}
 </body>
 </html>
 """
+TEMPLATE = Template(HTML_TEMPLATE, trim_blocks=True, lstrip_blocks=True)
+
+def read_sheets(excel_path, sheet_names) -> dict:
+    with pd.ExcelFile(excel_path) as xls:
+        return {sheet: xls.parse(sheet, header=None) for sheet in sheet_names}
+
+def format_cell(val) -> str:
+    # Whole floats print as they read back from the xlsx (1.0 -> "1")
+    if isinstance(val, float) and val.is_integer():
+        return str(int(val))
+    return str(val)
+
+def table_cells(df: pd.DataFrame) -> tuple:
+    # (cell texts, bordered flag of each row): name rows (first two cells filled)
+    # and cumul rows get borders
+    texts = df.fillna("").map(format_cell)
+    if texts.shape[1] < 2:
+        return texts, np.zeros(len(texts), dtype=bool)
+    first = texts.iloc[:, 0].astype(str).str.strip()
+    is_name_row = (first != "") & (texts.iloc[:, 1].astype(str).str.strip() != "")
+    is_cumul_row = first.str.lower() == "cumul"
+    return texts, (is_name_row | is_cumul_row).to_numpy(dtype=bool)
+
+def prepare_tables(sheets: dict) -> list:
+    # (title, cell texts, bordered flags) of each sheet, shared by every document
+    return [(SHEET_TITLES.get(sheet, sheet), *table_cells(df)) for sheet, df in sheets.items()]
+
+def result_groups(results: dict) -> list:
+    # Distribution groups of the week, as tagged by the contract extractors
+    groups = set()
+    for result in results.values():
+        groups.update(result.group_counts)
+    return sorted(groups)
+
+def group_tables(tables: list, group: str, groups: list, counts: list) -> list:
+    # The group's member rows and the lines shared by every group (titles...), without
+    # the other groups' summary lines (oeufs: "CSCB 17 boites de 6...").
+    # `counts`: {group: {column: count}} of each table (see StageResult.group_counts);
+    # the cumul line is recomputed with the group's counts, or dropped without them.
+    others = [g for g in groups if g != group]
+    selected = []
+    for (title, texts, bordered), table_counts in zip(tables, counts):
+        first = texts.iloc[:, 0].astype(str).str.strip().str.lower()
+        keep = pd.Series(True, index=texts.index) if table_counts else first != "cumul"
+        if "group" in texts.columns:
+            keep &= (texts["group"] == group) | (~texts["group"].isin(groups) & ~first.isin(others))
+        keep = keep.to_numpy(dtype=bool)
+        texts, bordered, first = texts[keep], bordered[keep], first[keep]
+        if table_counts:
+            texts = texts.copy()
+            columns = {col for group_counts in table_counts.values() for col in group_counts}
+            for col in columns & set(texts.columns):
+                texts.loc[first == "cumul", col] = format_cell(table_counts.get(group, {}).get(col, 0))
+        selected.append((f"{title} ({group})", texts, bordered))
+    return selected
+
+def html_rows(texts: pd.DataFrame, bordered: np.ndarray):
+    # (cell texts, row class) of each row, as the template asks for them
+    return zip(texts.itertuples(index=False, name=None), np.where(bordered, "name-row", "other-row"))
+
+def stream_html(tables: list):
+    # Chunks of the html document
+    return TEMPLATE.generate(tables=((title, html_rows(texts, bordered)) for title, texts, bordered in tables))
+
+def build_html(tables: list) -> str:
+    return "".join(stream_html(tables))
+
+# --- Renderers: render(tables) returns the pdf document as bytes
+
+def wkhtmltopdf_path() -> str:
+    # The Windows install location, else the one on the PATH
+    if Path(WKHTMLTOPDF_PATH).exists():
+        return WKHTMLTOPDF_PATH
+    return shutil.which("wkhtmltopdf")
+
+def render_builtin(tables: list) -> bytes:
+    # Tables laid out directly from the frames, in this process
+    return pdf_render.render_tables([
+        (title, texts.to_numpy().tolist(), bordered.tolist()) for title, texts, bordered in tables
+    ])
+
+def render_pdfkit(tables: list) -> bytes:
+    # Html printed by wkhtmltopdf (https://wkhtmltopdf.org)
+    if pdfkit is None:
+        raise RuntimeError("the pdfkit renderer needs the pdfkit package")
+    config = pdfkit.configuration(wkhtmltopdf=wkhtmltopdf_path() or WKHTMLTOPDF_PATH)
+    return pdfkit.from_string(build_html(tables), False, configuration=config)
+
+RENDERERS = {
+    "builtin": render_builtin,
+    "pdfkit": render_pdfkit,
+}
+
+def pick_renderer(name: str = "auto") -> str:
+    # "auto": wkhtmltopdf when it is installed, the builtin renderer otherwise
+    if name == "auto":
+        return "pdfkit" if pdfkit is not None and wkhtmltopdf_path() else "builtin"
+    return name
+
+def render_document(renderer: str, tables: list, pdf_output: Path) -> Span:
+    # Module-level so it can run in a worker process; returns its timing span
+    with measure("pdf.render", Path(pdf_output).name) as span:
+        Path(pdf_output).write_bytes(RENDERERS[renderer](tables))
+        span.rows = sum(len(texts) for _, texts, _ in tables)
+    return span
+
+def generate_pdf(sheets: dict, pdf_output, report: RunReport = None, renderer: str = "auto", groups: list = (),
+                 group_counts: dict = None):
+    # The combined pdf and, for each of `groups`, <pdf_output>_<group>.pdf with only
+    # that group's rows and cumul (`group_counts`: {sheet: {group: {column: count}}});
+    # the documents are rendered in parallel, one process per cpu
+    report = report or RunReport()
+    renderer = pick_renderer(renderer)
+    pdf_output = Path(pdf_output)
+    with report.stage("pdf.prepare") as span:
+        tables = prepare_tables(sheets)
+        documents = [(tables, pdf_output)]
+        counts = [(group_counts or {}).get(sheet) for sheet in sheets]
+        for group in groups:
+            documents.append((group_tables(tables, group, groups, counts),
+                              pdf_output.with_name(f"{pdf_output.stem}_{group}{pdf_output.suffix}")))
+        span.rows = sum(len(texts) for _, texts, _ in tables)
+
+    workers = min(len(documents), os.cpu_count() or 1)
+    if workers <= 1:
+        spans = [render_document(renderer, *document) for document in documents]
+    else:
+        # Spawned, not forked: the pdf stage runs in a thread next to other stages
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            spans = list(pool.map(render_document, repeat(renderer), *zip(*documents)))
+    report.add(spans)
+    return [path for _, path in documents]
+
+def run(context: PipelineContext, read_xlsx: bool = True) -> list:
+    # Returns the pdfs written. Without results in the context, the sheets are read back
+    # from the week's xlsx, unless `read_xlsx` is False: in the pipeline that file may be
+    # the previous run's, so nothing is written.
+    date_str = context.date_str
+    excel_file = context.folder / f"distrib_amap_{date_str}.xlsx"
+    pdf_file = context.folder / f"distrib_amap_{date_str}.pdf"
+    sheet_names = ["legumes_merged", "oeufs_merged"]
+
+    if not context.results and read_xlsx:
+        if not excel_file.exists():
+            print(f"❌ Excel file not found: {excel_file}")
+            return []
+        if context.pdf_per_group:
+            print("⚠️ Per-group pdfs need the extractors' results, only the combined one is generated")
+        return generate_pdf(read_sheets(excel_file, sheet_names), pdf_file, context.report, context.pdf_renderer)
+
+    # In the pipeline the extractors hand their frames over in memory
+    groups = result_groups(context.results) if context.pdf_per_group else ()
+    sheets, counts = {}, {}
+    for sheet in sheet_names:
+        prefix, name = sheet.split("_", 1)
+        result = context.results.get(prefix)
+        if result is None:
+            print(f"⚠️ Missing sheet: {sheet}")
+            continue
+        sheets[sheet] = result.sheets[name].df
+        counts[sheet] = result.group_counts
+    if not sheets:
+        print(f"⚠️ No contract results, {pdf_file.name} not generated")
+        return []
+    return generate_pdf(sheets, pdf_file, context.report, context.pdf_renderer, groups, counts)
 
-def get_next_saturday_sheetname():
-    today = datetime.today()
-    days_until_saturday = (5 - today.weekday()) % 7
-    saturday = today + timedelta(days=days_until_saturday)
-    return saturday.strftime("%Y-%m-%d")
-
-import pandas as pd
-import pdfkit
-from pathlib import Path
-
-def generate_pdf(excel_path, sheet_names, pdf_output):
-    config = pdfkit.configuration(wkhtmltopdf=r"C:/Program Files/wkhtmltopdf/bin/wkhtmltopdf.exe")
-
-    STYLE = """
-    <style>
-        table {
-            border-collapse: collapse;
-            width: 100%;
-            font-family: Arial, sans-serif;
-            font-size: 12px;
-        }
-        td, th {
-            padding: 4px;
-            text-align: left;
-        }
-        tr.name-row td {
-            border: 1px solid #000;
-        }
-        tr.other-row td {
-            border: none;
-        }
-    </style>
-    """
-
-    def df_to_html_custom(df: pd.DataFrame) -> str:
-        df.fillna("", inplace=True)
-        html_rows = []
-
-        for _, row in df.iterrows():
-            values = row.astype(str).tolist()
-            first_col = values[0].strip().lower()
-            is_name_row = bool(values[0].strip()) and bool(values[1].strip())
-            is_cumul_row = first_col == "cumul"
-            cls = "name-row" if is_name_row or is_cumul_row else "other-row"
-            row_html = f'<tr class="{cls}">' + "".join(f"<td>{v}</td>" for v in values) + "</tr>"
-            html_rows.append(row_html)
-
-        return "<table>\n" + "\n".join(html_rows) + "\n</table>"
-
-    # 📄 Display names for sheets
-    display_names = {
-        "legumes_merged": "Légumes",
-        "oeufs_merged": "Œufs"
-    }
-
-    html_parts = []
-    xls = pd.ExcelFile(excel_path)
-
-    for i, sheet in enumerate(sheet_names):
-        df = xls.parse(sheet, header=None)
-        html_table = df_to_html_custom(df)
-        page_break = '<div style="page-break-before: always;"></div>' if i > 0 else ""
-        title = {"legumes_merged": "Légumes", "oeufs_merged": "Œufs"}.get(sheet, sheet)
-
-        html_parts.append(
-            f"""{page_break}
-    <h2>{title}</h2>
-    {STYLE}
-    {html_table}
-    """
-        )
-
-    # Ensure full UTF-8 compatibility
-    tmp_html_path = Path("tmp_combined.html")
-    tmp_html_path.write_text(
-        "<!DOCTYPE html><html><head><meta charset='UTF-8'></head><body>" +
-        "\n".join(html_parts) +
-        "</body></html>", encoding="utf-8"
-    )
-
-
-    pdfkit.from_file(str(tmp_html_path), str(pdf_output), configuration=config)
-    tmp_html_path.unlink(missing_ok=True)
 
 def main():
-    date_str = get_next_saturday_sheetname()
-    excel_file = Path(f"distrib_amap_{date_str}.xlsx")
-    pdf_file = Path(f"distrib_amap_{date_str}.pdf")
-    sheets = ["legumes_merged", "oeufs_merged"]
+    run(PipelineContext())
 
-    if excel_file.exists():
-        generate_pdf(excel_file, sheets, pdf_file)
-    else:
-        print(f"❌ Excel file not found: {excel_file}")
 
 if __name__ == "__main__":
     main()
+
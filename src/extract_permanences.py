@@ -1,53 +1,142 @@
 import pandas as pd
 from pathlib import Path
-from datetime import datetime, timedelta
+from datetime import datetime
 import re
 
-def main():
+from cache import CACHE_DIR
+from pipeline import PipelineContext, StageResult
+
+TASK_GROUP_PATTERN = r"Distribution légumes ([a-zA-Z]+)"
+# Kept next to the parse cache, but not subject to its eviction
+INDEX_FILE = "permanences.index"
+# Bump when the way rows are indexed changes
+INDEX_VERSION = 2
+
+
+def index_rows(df: pd.DataFrame) -> pd.DataFrame:
+    # One file's rows, with a parsed Date and the group, indexed by (date, group, task)
+    df = df.dropna(how="all").dropna(axis=1, how="all")
+    if "Date" not in df.columns or "Tâche" not in df.columns:
+        return None
+    group = (
+        df["Tâche"].astype(str)
+        .str.extract(TASK_GROUP_PATTERN, flags=re.IGNORECASE, expand=False)
+        .str.lower()
+        .fillna("unknown")
+    )
+    df = df.assign(
+        Date=pd.to_datetime(df["Date"], errors='coerce').dt.date,
+        group=group,
+        _row=range(len(df)),
+    )
+    # Rows without a usable date (notes...) never match a Saturday; kept, several of
+    # them would be returned by .loc for a date missing from the file
+    df = df[df["Date"].notna()]
+    index = pd.MultiIndex.from_arrays([df["Date"], df["group"], df["Tâche"]], names=["date", "group", "task"])
+    return df.set_axis(index).sort_index()
+
 
-    def get_next_saturday():
-        today = datetime.today()
-        days_until_saturday = (5 - today.weekday()) % 7
-        return (today + timedelta(days=days_until_saturday)).date()
+# Rows of every Distribution_AMAP file, by file, refreshed only for files
+# that were added or changed since the last run
+class PermanenceIndex:
+    def __init__(self, folder: Path, persist: bool = True):
+        self.path = Path(folder) / CACHE_DIR / INDEX_FILE if persist else None
+        self.files = {}  # file name -> ((size, mtime), indexed rows or None)
+        if self.path is not None and self.path.exists():
+            try:
+                stored = pd.read_pickle(self.path)
+                if stored.get("version") == INDEX_VERSION:
+                    self.files = stored["files"]
+            except Exception as e:
+                print(f"⚠️ Rebuilding the permanence index: {e}")
 
-    def extract_group(task_str):
-        match = re.search(r"Distribution légumes ([a-zA-Z]+)", str(task_str), flags=re.IGNORECASE)
-        return match.group(1).lower() if match else "unknown"
+    def refresh(self, files: list):
+        # `files`: the InputFile of every Distribution_AMAP workbook (see discover.py)
+        changed = False
+        names = {f.path.name for f in files}
+        for name in [name for name in self.files if name not in names]:
+            del self.files[name]
+            changed = True
 
-    def read_filtered_file(path: Path, target_date: datetime.date):
+        for f in files:
+            signature = (f.size, f.mtime_ns)
+            entry = self.files.get(f.path.name)
+            if entry is not None and entry[0] == signature:
+                continue
+            try:
+                rows = index_rows(pd.read_excel(f.path))
+            except Exception as e:
+                print(f"❌ Failed to read {f.path.name}: {e}")
+                self.files.pop(f.path.name, None)
+                continue
+            self.files[f.path.name] = (signature, rows)
+            changed = True
+
+        if changed and self.path is not None:
+            self.path.parent.mkdir(exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            pd.to_pickle({"version": INDEX_VERSION, "files": self.files}, tmp)
+            tmp.replace(self.path)
+
+    def roster(self, name: str, target_date: datetime.date) -> pd.DataFrame:
+        # The file's rows for that Saturday, in their original order
+        entry = self.files.get(name)
+        if entry is None:
+            return None
+        rows = entry[1]
+        if rows is None:
+            print(f"⚠️ Skipping {name}: missing expected columns.")
+            return None
         try:
-            df = pd.read_excel(path)
-            df = df.dropna(how="all").dropna(axis=1, how="all")
-            if "Date" not in df.columns or "Tâche" not in df.columns:
-                print(f"⚠️ Skipping {path.name}: missing expected columns.")
-                return None
-            df["Date"] = pd.to_datetime(df["Date"], errors='coerce').dt.date
-            df = df[df["Date"] == target_date]
-            if df.empty:
-                return None
-            df["group"] = df["Tâche"].apply(extract_group)
-            return df
-        except Exception as e:
-            print(f"❌ Failed to read {path.name}: {e}")
+            rows = rows.loc[[target_date]]
+        except KeyError:
             return None
+        return rows.sort_values("_row").drop(columns="_row").reset_index(drop=True)
+
+
+def run(context: PipelineContext):
+
+    def load_index(files: list) -> PermanenceIndex:
+        # In a season run the index is refreshed once and shared by every Saturday
+        season = context.season
+        if season is not None and "permanences" in season.loaded:
+            return season.loaded["permanences"]
+        index = PermanenceIndex(context.folder, persist=context.use_cache)
+        index.refresh(files)
+        if season is not None:
+            season.loaded["permanences"] = index
+        return index
 
     def merge_amap_distributions(folder=".") -> pd.DataFrame:
         folder = Path(folder)
-        files = list(folder.glob("Distribution_AMAP*.xlsx"))
-        target_date = get_next_saturday()
-        all_rows = [read_filtered_file(f, target_date) for f in files]
-        all_rows = [df for df in all_rows if df is not None]
-        merged_perms = pd.concat(all_rows, ignore_index=True) if all_rows else pd.DataFrame()
-    
-        output_path = folder / "merged_distributions_permanences.xlsx"
-        with pd.ExcelWriter(output_path, engine="openpyxl") as writer:
-            merged_perms.to_excel(writer, sheet_name="merged", index=False, header=True)
-
-        print(f"✅ File saved: {output_path.name}")
+        files = context.input_files().of_kind("permanences")
+        with context.report.stage("permanences.index"):
+            index = load_index(files)
+        with context.report.stage("permanences.lookup") as span:
+            all_rows = [index.roster(f.path.name, context.target_date) for f in files]
+            all_rows = [df for df in all_rows if df is not None]
+            merged_perms = pd.concat(all_rows, ignore_index=True) if all_rows else pd.DataFrame()
+            span.set_shape(merged_perms)
+
+        result = StageResult()
+        result.add("merged", merged_perms, header=True)
+
+        if context.keep_intermediate:
+            output_path = folder / "merged_distributions_permanences.xlsx"
+            result.to_excel(output_path)
+            print(f"✅ File saved: {output_path.name}")
+
+        return result
 
     # Usage
-    merge_amap_distributions(".")
+    result = merge_amap_distributions(context.folder)
+    context.results["permanences"] = result
+    return result
+
+
+def main():
+    run(PipelineContext(keep_intermediate=True))
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
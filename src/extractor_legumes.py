@@ -1,309 +1,236 @@
+import numpy as np
 import pandas as pd
-import re
-from datetime import datetime, timedelta
-from pathlib import Path
-from openpyxl.styles import Border, Side, PatternFill
-from openpyxl.utils.dataframe import dataframe_to_rows
-
-
-def clean_and_format(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.dropna(how="all").dropna(axis=1, how="all")
-
-    # Detect header row
-    header_row_idx = None
-    for i in range(min(10, len(df))):
-        row = df.iloc[i].fillna('').astype(str).str.lower()
-        if "nom" in row.tolist() or "prénom" in row.tolist():
-            header_row_idx = i
-            break
-    if header_row_idx is None:
-        raise ValueError("No usable header row found (no 'Nom' or 'Prénom').")
-
-    df.columns = df.iloc[header_row_idx].fillna('').astype(str).str.strip()
-    df = df.iloc[header_row_idx + 1:].reset_index(drop=True)
-
-    # Remove previous "Cumul" rows
-    df = df[~df.iloc[:, 0].astype(str).str.lower().str.contains("cumul", na=False)]
-
-    # Ensure column names are unique
-    df.columns = df.columns.astype(str)
-    if df.columns.duplicated().any():
-        df.columns = [
-            f"{col}_{i}" if df.columns.duplicated()[i] else col
-            for i, col in enumerate(df.columns)
-        ]
-
-    def parse_number(val):
-        if isinstance(val, str) and re.match(r"^\d{1,2}-\d{2}$", val.strip()):
-            return float(val.strip().replace("-", "."))
-        try:
-            return float(val)
-        except:
-            return val
-
-    return df
-
-# --- Setup ---
-folder = Path('.')
-pattern = 'feuille-distribution-contrat-legumes-2025'
-today = datetime.today()
-days_until_saturday = (5 - today.weekday()) % 7
-saturday = today + timedelta(days=days_until_saturday)
-sheet_name = saturday.strftime("%Y-%m-%d")
-
-xlsx_files = list(folder.glob(f"{pattern}-*.xlsx"))
-# print("Found files:", [f.name for f in xlsx_files])
-
-merged_data = []
-cleaned_sheets = {}
-raw_sheets = {}
-static_lines = None
-
-# --- Load and process each file ---
-for file in xlsx_files:
-    match = re.search(rf"{pattern}-([a-z0-9\- ]+)(?:\s\(\d+\))?\.xlsx", file.name, re.IGNORECASE)
-    if not match:
-        continue
-    group = match.group(1).strip().lower()
-
-    try:
-        df = pd.read_excel(file, sheet_name=sheet_name, header=None)
-    except ValueError:
-        df = pd.read_excel(file, header=None)
-
-    # --- Extract static header rows before the 'Nom'/'Prénom' line ---
-    # Extract static lines from the first valid file only
-    if static_lines is None:
-        for i in range(min(10, len(df))):
-            values = df.iloc[i].fillna('').astype(str).str.lower()
-            
-            if static_lines is None:
-                for i in range(len(df)):
-                    values = df.iloc[i].fillna('').astype(str).str.lower()
-                    if "cumul" in values.tolist():
-                        static_lines = df.iloc[:i + 1].dropna(how="all").dropna(axis=1, how="all")
-                        break
-
-
-    df_clean = clean_and_format(df)
-    df_clean["group"] = group
-    merged_data.append(df_clean)
-
-    cleaned_sheets[group] = df_clean.drop(columns="group", errors='ignore')
-    raw_sheets[group] = df
-
-# --- Build merged output ---
-if merged_data:
-    final_df = pd.concat(merged_data, ignore_index=True)
-    dedup_columns = [col for col in final_df.columns if col != "group"]
-    final_df = final_df.drop_duplicates(subset=dedup_columns)
-
-
-    # Format static lines into a 10-row DataFrame
-    # static_rows_df = pd.DataFrame(static_lines[:10])
-    static_rows_df = static_lines
-
-    # Pad with empty columns to match merged shape
-    while static_rows_df.shape[1] < final_df.shape[1]:
-        static_rows_df[static_rows_df.shape[1]] = ""
-    # Rename columns of static section to match merged
-    static_rows_df.columns = final_df.columns[:static_rows_df.shape[1]]
-
-    # Prepend static lines above merged data
-    #merged_with_header = pd.concat([static_rows_df, final_df], ignore_index=True)
-
-
-    # --- Convert columns for numeric aggregation
-    for col in ["legumes", "legumes_3"]:
-        if col in final_df.columns:
-            final_df[col] = pd.to_numeric(final_df[col], errors="coerce")
-
-    # --- Detect and separate static-like rows (inner)
-    def is_static_row(row):
-        vals = row.fillna('').astype(str).str.lower().values
-        return any(re.match(r"^\d{1,2}-\d{2}$", v) or "vrac" in v for v in vals)
-
-    inner_static = final_df[final_df.apply(is_static_row, axis=1)]
-    real_data = final_df[~final_df.apply(is_static_row, axis=1)]
-
-
-
-    # Safe number parsing only on real_data
-    def safe_parse_number(val):
-        if isinstance(val, str) and re.match(r"^\d{1,2}-\d{2}$", val.strip()):
-            return float(val.strip().replace("-", "."))
-        try:
-            return float(val)
-        except:
-            return val
-
-    for col in real_data.columns[2:]:
-        real_data[col] = real_data[col].map(safe_parse_number)
-
-    # --- Compute cumul only from rows where value == 1
-    valid_rows = real_data[
-        ((real_data.get("legumes") == 1) | (real_data.get("legumes_3") == 1))
-    ]
-    cumul_counts = {
-        col: (valid_rows[col] == 1).sum()
-        for col in ["legumes", "legumes_3"]
-        if col in valid_rows.columns
-    }
-
-    # cumul_row = {col: "" for col in final_df.columns}
-    # cumul_row.update(cumul_counts)
-    # cumul_row[final_df.columns[0]] = "Cumul"
-
-    # --- Combine top-of-file static lines
-    static_top = static_lines.drop_duplicates().reset_index(drop=True)
-
-    # Create final cumul row
-    cumul_row = {col: "" for col in final_df.columns}
-    cumul_row.update(cumul_counts)
-    cumul_row[final_df.columns[0]] = "Cumul"
-    cumul_row_df = pd.DataFrame([cumul_row])
-
-    # Replace Cumul line in static_lines if exists
-    if static_lines is not None:
-        static_lines = static_lines.copy()
-        static_lines.columns = final_df.columns[:static_lines.shape[1]]
-        
-        # cumul_idx = static_lines.iloc[:, 0].astype(str).str.lower() == "cumul"
-        # if cumul_idx.any():
-        #     static_lines.loc[cumul_idx, :] = cumul_row_df.iloc[0, :static_lines.shape[1]].values
-        # else:
-        #     static_lines = pd.concat([static_lines, cumul_row_df.iloc[:, :static_lines.shape[1]]], ignore_index=True)
-
-        static_lines = static_lines[~static_lines.iloc[:, 0].astype(str).str.lower().eq("cumul")]
-
-
-    # Drop 'group' column from static_lines if it exists
-    inner_static = inner_static.drop(columns='group', errors='ignore')
-    static_lines = static_lines.drop(columns='group', errors='ignore')
-
-    # Insert a blank row after static_lines (before headers)
-    empty_row_df = pd.DataFrame([[""] * final_df.shape[1]], columns=final_df.columns)
-    
-    # Final export
-    full_merged = pd.concat([
-        static_lines.reset_index(drop=True),
-        empty_row_df,
-        cumul_row_df,
-        empty_row_df.copy(),
-        real_data.reset_index(drop=True)
-    ], ignore_index=True)
-
-    # --- Clean stray group-only rows
-    def is_group_only_row(row):
-        non_empty = row.astype(str).str.strip().replace("nan", "").replace("None", "") != ""
-        return non_empty.sum() == 1 and row.get("group", "") in row.values
-
-    # Replace those rows with empty strings
-    full_merged = full_merged.apply(
-        lambda row: pd.Series(["" for _ in row], index=row.index) if is_group_only_row(row) else row,
-        axis=1
-    )
+from pandas.api.types import is_numeric_dtype
+
+from ingest import load_group_sheets
+from layout import SheetLayout, detect_layout, header_table
+from pipeline import RAW_SHEET_GROUPS, PipelineContext, StageResult
+from schema import group_counts, member_rows, member_table, subscription_counts, to_output
+
+
+def clean_and_format(df: pd.DataFrame, layout: SheetLayout = None) -> pd.DataFrame:
+    return header_table(df, layout if layout is not None else detect_layout(df))
+
+
+# "NN-NN" cells (e.g. "2-55") hold prices on the static lines
+STATIC_VALUE_PATTERN = r"^\d{1,2}-\d{2}$"
+
+
+def static_row_mask(df: pd.DataFrame) -> pd.Series:
+    # Rows with a "NN-NN" or "vrac" cell, checked over all cells at once
+    cells = pd.Series(df.fillna('').astype(str).to_numpy().ravel()).str.lower()
+    hits = cells.str.match(STATIC_VALUE_PATTERN) | cells.str.contains("vrac", regex=False)
+    return pd.Series(hits.to_numpy(dtype=bool).reshape(df.shape).any(axis=1), index=df.index)
+
+
+def parse_numbers(col: pd.Series) -> pd.Series:
+    # Column-wise safe number parsing: "NN-NN" -> NN.NN, numbers and
+    # numeric strings -> float, anything else is left untouched
+    if is_numeric_dtype(col):
+        return col.astype(float)
+    if not (col.dtype == object or isinstance(col.dtype, pd.StringDtype)):
+        return col
+
+    text = col.str.strip()
+    is_static = text.str.match(STATIC_VALUE_PATTERN).fillna(False).astype(bool)
+    candidate = text.where(text.notna(), col).astype(object)
+    candidate[is_static] = text[is_static].str.replace("-", ".", regex=False)
+    numeric = pd.to_numeric(candidate, errors="coerce")
+    return col.astype(object).where(numeric.isna(), numeric.astype(float)).infer_objects()
 
-    # Drop blank rows in real_data to avoid confusion
-    real_data = real_data.dropna(how="all")
-
-    # Insert blank rows as empty DataFrames
-    empty_row = pd.DataFrame({col: [None] for col in final_df.columns})
-    empty_row["group"] = ""  # Explicitly blank the group column
-
-    # Drop rows where only 'group' column has a value
-    group_col = full_merged.columns[-1]
-    full_merged = full_merged[
-        ~((full_merged.notna().sum(axis=1) == 1) & full_merged[group_col].notna())
-    ]
-
-    # Combine in the right order
-    full_merged = pd.concat([
-        static_lines,
-        empty_row,
-        cumul_row_df,
-        empty_row.copy(),
-        real_data
-    ], ignore_index=True)
-
-    # --- Save to Excel
-    with pd.ExcelWriter("merged_distributions_legumes.xlsx", engine="openpyxl") as writer:
-        # Write full merged sheet
-        # full_merged = pd.concat(
-        #     [static_top, inner_static.drop_duplicates(), real_data, pd.DataFrame([cumul_row])],
-        #     ignore_index=True
-        # )
-        full_merged.to_excel(writer, sheet_name="merged", index=False, header=False)
-
-        
-        # --- Style after writing
-        wb = writer.book
-        ws = wb["merged"]
-
-        # Define styles
-        border = Border(
-            left=Side(border_style="thin", color="000000"),
-            right=Side(border_style="thin", color="000000"),
-            top=Side(border_style="thin", color="000000"),
-            bottom=Side(border_style="thin", color="000000"),
-        )
-        group_fill = PatternFill(start_color="FFFFCC", end_color="FFFFCC", fill_type="solid")
-
-        # --- Locate key columns
-        name_col_idx = 1  # "Nom" is in the first column (A)
-        group_col_idx = ws.max_column
-
-        # --- Skip static lines
-        static_line_count = len(static_lines) if static_lines is not None else 0
-        prev_group = None
 
-        # Skip border styling for first two title rows
-        skip_border_rows = {1, 2}
+def text_values(col: pd.Series) -> pd.Series:
+    # Cell text as read back from the written sheet (empty cells -> "")
+    col = col.where(col.notna() & col.astype(bool), "")
+    return col.astype(str).str.strip().str.lower()
 
-        for i, row in enumerate(ws.iter_rows(min_row=1, max_row=ws.max_row), start=1):
-            if i in skip_border_rows:
-                continue  # Skip title rows
 
-            row_values = [cell.value for cell in row]
-            nom_val = row[name_col_idx - 1].value if name_col_idx - 1 < len(row) else None
-            group_val = row[group_col_idx - 1].value if group_col_idx - 1 < len(row) else None
-            nom = str(nom_val).strip().lower() if nom_val else ""
-            group = str(group_val).strip().lower() if group_val else ""
+def row_styles(df: pd.DataFrame, static_rows: int) -> pd.DataFrame:
+    # Decides in one pass which rows of the merged sheet are dropped (stray
+    # group-only rows), which get borders (static lines, members, cumul) and
+    # which get the group fill (first member row of each group)
+    cells = pd.Series(df.fillna("").astype(str).to_numpy().ravel()).str.strip()
+    non_empty = (~cells.isin(["", "None", "nan"])).to_numpy(dtype=bool).reshape(df.shape)
+    drop = (non_empty.sum(axis=1) == 1) & non_empty[:, -1]
 
-            is_static_line = i <= static_line_count
-            is_real_name = nom and nom not in {"nan", "nom", "prénom", "cumul"}
-            is_cumul = nom == "cumul"
+    kept = df[~drop]
+    line = np.arange(1, len(kept) + 1)  # row number in the written sheet
+    names = text_values(kept.iloc[:, 0]).to_numpy()
+    groups = text_values(kept.iloc[:, -1])
 
-            if is_static_line or is_real_name or is_cumul:
-                for cell in row:
-                    cell.border = border
+    is_title = line <= 2  # first two title rows are left unstyled
+    is_real_name = (names != "") & ~np.isin(names, ["nan", "nom", "prénom", "cumul"])
+    is_cumul = names == "cumul"
+    border = ~is_title & ((line <= static_rows) | is_real_name | is_cumul)
 
-            if i > static_line_count and group and group != prev_group and is_real_name:
-                for cell in row:
-                    cell.fill = group_fill
-                prev_group = group
+    candidates = ~is_title & (line > static_rows) & (groups.to_numpy() != "") & is_real_name
+    candidate_groups = groups[candidates]
+    first_of_group = candidate_groups.ne(candidate_groups.shift())
 
-            
-            # Post-process: remove rows where only the group column has a value
-            rows_to_delete = []
-            for i, row in enumerate(ws.iter_rows(min_row=1, max_row=ws.max_row), start=1):
-                values = [str(cell.value).strip() for cell in row]
-                non_empty_count = sum(v not in {"", "None", "nan"} for v in values)
-                if non_empty_count == 1 and values[-1]:  # Only group column is non-empty
-                    rows_to_delete.append(i)
+    styles = pd.DataFrame({"drop": drop, "border": False, "fill": False}, index=df.index)
+    styles.loc[kept.index, "border"] = border
+    styles.loc[first_of_group[first_of_group].index, "fill"] = True
+    return styles
 
-            # Delete rows in reverse to keep indices correct
-            for i in reversed(rows_to_delete):
-                ws.delete_rows(i)
 
+def run(context: PipelineContext):
+    # --- Setup ---
+    folder = context.folder
+    sheet_name = context.date_str
 
-        # Write raw sheets for selected groups
+    # Sorted so that groups always come out in the same order
+    group_files = context.input_files().group_files("legumes")
+
+    # --- Read and clean the group workbooks (in parallel when workers > 1)
+    # Raw sheets are only kept for the exported groups
+    keep_raw = {file for group, file in group_files if group in RAW_SHEET_GROUPS}
+    loaded = load_group_sheets(
+        [file for _, file in group_files], sheet_name, clean_and_format,
+        workers=context.workers, cache=context.cache, season=context.season, report=context.report,
+        keep_raw=keep_raw,
+    )
+
+    merged_data = []
+    cleaned_sheets = {}
+    raw_sheets = {}
+    static_lines = None
+
+    # --- Process each file ---
+    for (group, file), (df, df_clean, static) in zip(group_files, loaded):
+        # --- Extract static header rows before the 'Nom'/'Prénom' line ---
+        # Extract static lines from the first valid file only
+        if static_lines is None and static is not None:
+            static_lines = static.copy()  # padded below, the cached frame stays as read
+
+        merged_data.append(df_clean.assign(group=group))
+        if context.store_db:  # only the season database reads them
+            cleaned_sheets[group] = df_clean
+        if group in RAW_SHEET_GROUPS:
+            raw_sheets[group] = df
+
+    # --- Build merged output ---
+    if merged_data:
+        with context.report.stage("legumes.dedup") as span:
+            final_df = pd.concat(merged_data, ignore_index=True)
+            dedup_columns = [col for col in final_df.columns if col != "group"]
+            final_df = final_df.drop_duplicates(subset=dedup_columns)
+            span.set_shape(final_df)
+
+
+        # Format static lines into a 10-row DataFrame
+        # static_rows_df = pd.DataFrame(static_lines[:10])
+        static_rows_df = static_lines
+
+        # Pad with empty columns to match merged shape
+        while static_rows_df.shape[1] < final_df.shape[1]:
+            static_rows_df[static_rows_df.shape[1]] = ""
+        # Rename columns of static section to match merged
+        static_rows_df.columns = final_df.columns[:static_rows_df.shape[1]]
+
+        # Prepend static lines above merged data
+        #merged_with_header = pd.concat([static_rows_df, final_df], ignore_index=True)
+
+
+        # --- Convert columns for numeric aggregation
+        for col in ["legumes", "legumes_3"]:
+            if col in final_df.columns:
+                final_df[col] = pd.to_numeric(final_df[col], errors="coerce")
+
+        # --- Detect and separate static-like rows (inner)
+        with context.report.stage("legumes.classify") as span:
+            real_data = member_rows(final_df, static_row_mask(final_df))
+
+            # Safe number parsing only on real_data, then typed member table
+            for col in real_data.columns[2:]:
+                real_data[col] = parse_numbers(real_data[col])
+            members = member_table(real_data)
+            span.set_shape(members)
+
+        # --- Compute cumul only from rows where value == 1
+        cumul_counts = subscription_counts(members, ["legumes", "legumes_3"])
+        counts_by_group = group_counts(members, ["legumes", "legumes_3"])
+
+        # cumul_row = {col: "" for col in final_df.columns}
+        # cumul_row.update(cumul_counts)
+        # cumul_row[final_df.columns[0]] = "Cumul"
+
+        # --- Combine top-of-file static lines
+        static_top = static_lines.drop_duplicates().reset_index(drop=True)
+
+        # Create final cumul row
+        cumul_row = {col: "" for col in final_df.columns}
+        cumul_row.update(cumul_counts)
+        cumul_row[final_df.columns[0]] = "Cumul"
+        cumul_row_df = pd.DataFrame([cumul_row])
+
+        # Replace Cumul line in static_lines if exists
+        if static_lines is not None:
+            static_lines = static_lines.copy()
+            static_lines.columns = final_df.columns[:static_lines.shape[1]]
+
+            # cumul_idx = static_lines.iloc[:, 0].astype(str).str.lower() == "cumul"
+            # if cumul_idx.any():
+            #     static_lines.loc[cumul_idx, :] = cumul_row_df.iloc[0, :static_lines.shape[1]].values
+            # else:
+            #     static_lines = pd.concat([static_lines, cumul_row_df.iloc[:, :static_lines.shape[1]]], ignore_index=True)
+
+            static_lines = static_lines[~static_lines.iloc[:, 0].astype(str).str.lower().eq("cumul")]
+
+
+        # Drop 'group' column from static_lines if it exists
+        static_lines = static_lines.drop(columns='group', errors='ignore')
+
+        # Drop blank rows in real_data to avoid confusion
+        real_data = to_output(members).dropna(how="all")
+
+        # Insert blank rows as empty DataFrames
+        empty_row = pd.DataFrame({col: [None] for col in final_df.columns})
+        empty_row["group"] = ""  # Explicitly blank the group column
+
+        # Combine in the right order
+        full_merged = pd.concat([
+            static_lines,
+            empty_row,
+            cumul_row_df,
+            empty_row.copy(),
+            real_data
+        ], ignore_index=True)
+
+        # --- Style decisions, stray group-only rows are dropped here rather than in the sheet
+        static_line_count = len(static_lines) if static_lines is not None else 0
+        with context.report.stage("legumes.styles") as span:
+            styles = row_styles(full_merged, static_line_count)
+            keep = ~styles["drop"]
+            full_merged = full_merged[keep].reset_index(drop=True)
+            styles = styles.loc[keep, ["border", "fill"]].reset_index(drop=True)
+            span.set_shape(full_merged)
+
+        # --- Keep outputs in memory for the next stages
+        result = StageResult(cleaned=cleaned_sheets, group_counts=counts_by_group)
+        result.add("merged", full_merged, static_rows=static_line_count, row_styles=styles)
+
+        # Raw sheets for selected groups
         for group, raw_df in raw_sheets.items():
-                if group in {"cscb", "four", "mjc"}:
-                    raw_sheet_name = f"{group}".replace(" ", "_")[:31]
-                    raw_df.to_excel(writer, sheet_name=raw_sheet_name, index=False)
-
-    print("✅ File saved: merged_distributions_legumes.xlsx")
- 
-else:
-    print("⚠️ No usable data extracted.")
+            raw_sheet_name = f"{group}".replace(" ", "_")[:31]
+            result.add(raw_sheet_name, raw_df, header=True)
+
+        if context.keep_intermediate:
+            output_path = folder / "merged_distributions_legumes.xlsx"
+            result.to_excel(output_path)
+            print(f"✅ File saved: {output_path.name}")
+
+        context.results["legumes"] = result
+        return result
+
+    else:
+        print("⚠️ No usable data extracted.")
+        # A previous run's sheet (--watch) must not be written again
+        context.results.pop("legumes", None)
+
+
+def main():
+    run(PipelineContext(keep_intermediate=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,99 +1,121 @@
+import numpy as np
 import pandas as pd
 import re
-from datetime import datetime, timedelta
-from pathlib import Path
 
-def main():
-    # Define cleaning and formatting function
-    def clean_and_format(df: pd.DataFrame) -> pd.DataFrame:
-        df = df.dropna(how="all").dropna(axis=1, how="all")
-
-        # Detect header row
-        header_row_idx = None
-        for i in range(min(10, len(df))):
-            row = df.iloc[i].fillna('').astype(str).str.lower()
-            if "nom" in row.tolist() or "prénom" in row.tolist():
-                header_row_idx = i
-                break
-        if header_row_idx is None:
-            raise ValueError("No usable header row found (no 'Nom' or 'Prénom').")
-
-        df.columns = df.iloc[header_row_idx].fillna('').astype(str).str.strip()
-        df = df.iloc[header_row_idx + 1:].reset_index(drop=True)
-
-        # Remove previous "Cumul" rows
-        df = df[~df.iloc[:, 0].astype(str).str.lower().str.contains("cumul", na=False)]
-
-        # Ensure column names are unique
-        df.columns = df.columns.astype(str)
-        if df.columns.duplicated().any():
-            df.columns = [
-                f"{col}_{i}" if df.columns.duplicated()[i] else col
-                for i, col in enumerate(df.columns)
-            ]
-
-        def parse_number(val):
-            if isinstance(val, str) and re.match(r"^\d{1,2}-\d{2}$", val.strip()):
-                return float(val.strip().replace("-", "."))
-            try:
-                return float(val)
-            except:
-                return val
-
-        def is_static_like(val):
-            return isinstance(val, str) and re.match(r"^\d{1,2}-\d{2}$", val.strip())
-
-        # Flag rows with any static-like string (e.g., "2-55")
-        static_mask = df.map(is_static_like).any(axis=1)
-
-        # Only parse numeric columns in non-static rows
-        for col in df.columns[2:]:
-            df.loc[~static_mask, col] = df.loc[~static_mask, col].map(parse_number)
-
-
-        return df
+from ingest import load_group_sheets
+from layout import SheetLayout, detect_layout, header_table
+from pipeline import RAW_SHEET_GROUPS, PipelineContext, StageResult
+from schema import group_counts, member_rows, member_table, subscription_counts, to_output
 
-    # --- Setup ---
-    folder = Path('.')
-    pattern = 'feuille-distribution-contrat-oeufs-2024-2025'
-    today = datetime.today()
-    days_until_saturday = (5 - today.weekday()) % 7
-    saturday = today + timedelta(days=days_until_saturday)
-    sheet_name = saturday.strftime("%Y-%m-%d")
 
-    xlsx_files = list(folder.glob(f"{pattern}-*.xlsx"))
+# Define cleaning and formatting function
+def clean_and_format(df: pd.DataFrame, layout: SheetLayout = None) -> pd.DataFrame:
+    df = header_table(df, layout if layout is not None else detect_layout(df))
+
+    def parse_number(val):
+        if isinstance(val, str) and re.match(r"^\d{1,2}-\d{2}$", val.strip()):
+            return float(val.strip().replace("-", "."))
+        try:
+            return float(val)
+        except:
+            return val
+
+    def is_static_like(val):
+        return isinstance(val, str) and re.match(r"^\d{1,2}-\d{2}$", val.strip())
+
+    # Flag rows with any static-like string (e.g., "2-55")
+    static_mask = df.map(is_static_like).any(axis=1)
+
+    # Only parse numeric columns in non-static rows
+    for col in df.columns[2:]:
+        df.loc[~static_mask, col] = df.loc[~static_mask, col].map(parse_number)
+
+
+    return df
+
+
+# "NN-NN" cells (e.g. "2-55") hold prices on the static lines
+STATIC_VALUE_PATTERN = r"^\d{1,2}-\d{2}$"
+# Separates cell values inside a row key
+KEY_SEPARATOR = "\x1f"
+
+
+def cell_text(df: pd.DataFrame) -> pd.Series:
+    # Every cell as text, row by row ("" for empty cells)
+    cells = pd.Series(df.to_numpy(dtype=object).ravel())
+    return cells.astype(str).where(cells.notna(), "")
+
+
+def static_row_mask(df: pd.DataFrame) -> pd.Series:
+    # Rows without a name (first two columns blank) holding a "NN-NN", "vrac" or "oeufs" cell
+    text = cell_text(df).str.lower()
+    hits = text.str.match(STATIC_VALUE_PATTERN) | text.str.contains("vrac", regex=False) | text.str.contains("oeufs", regex=False)
+    hits = hits.to_numpy(dtype=bool).reshape(df.shape)
+    blank = (text.str.strip() == "").to_numpy(dtype=bool).reshape(df.shape)
+    return pd.Series(blank[:, :2].all(axis=1) & hits.any(axis=1), index=df.index)
+
+
+def row_keys(df: pd.DataFrame, normalize: bool = True) -> np.ndarray:
+    # One 64-bit hash per row, built column by column.
+    # normalize: only the non-empty cells count, stripped and lower-cased, wherever they
+    # are, and the group is ignored; otherwise each cell counts as is, in its column.
+    if normalize:
+        df = df.drop(columns="group", errors="ignore")
+        text = cell_text(df).str.strip().str.lower()
+    else:
+        text = cell_text(df).where(df.notna().to_numpy().ravel(), "\0")
+    text = text.to_numpy(dtype=object).reshape(df.shape)
+
+    keys = np.full(len(df), "", dtype=object)
+    for j in range(text.shape[1]):
+        col = text[:, j]
+        keys = keys + (np.where(col != "", col + KEY_SEPARATOR, "") if normalize else col + KEY_SEPARATOR)
+    return pd.util.hash_array(keys)
+
+
+def blank_run_mask(df: pd.DataFrame) -> np.ndarray:
+    # False on the 2nd, 3rd... row of each run of blank rows (all cells ""), to keep at most one
+    blank = (cell_text(df).where(df.notna().to_numpy().ravel(), "nan").str.strip() == "")
+    blank = blank.to_numpy(dtype=bool).reshape(df.shape).all(axis=1)
+    repeated = blank.copy()
+    repeated[0:1] = False
+    repeated[1:] &= blank[:-1]
+    return ~repeated
+
+
+def run(context: PipelineContext):
+    # --- Setup ---
+    folder = context.folder
+    sheet_name = context.date_str
+
+    # Sorted so that groups always come out in the same order
+    group_files = context.input_files().group_files("oeufs")
+
+    # --- Read and clean the group workbooks (in parallel when workers > 1)
+    # Raw sheets are only kept for the exported groups
+    keep_raw = {file for group, file in group_files if group in RAW_SHEET_GROUPS}
+    loaded = load_group_sheets(
+        [file for _, file in group_files], sheet_name, clean_and_format,
+        workers=context.workers, cache=context.cache, season=context.season, report=context.report,
+        keep_raw=keep_raw,
+    )
 
     merged_data = []
     cleaned_sheets = {}
     raw_sheets = {}
     static_lines = None
 
-    # --- Load and process each file ---
-    for file in xlsx_files:
-        match = re.search(rf"{pattern}-([a-z0-9\- ]+)(?:\s\(\d+\))?\.xlsx", file.name, re.IGNORECASE)
-        if not match:
-            continue
-        group = match.group(1).strip().lower()
-
-        try:
-            df = pd.read_excel(file, sheet_name=sheet_name, header=None)
-        except ValueError:
-            df = pd.read_excel(file, header=None)
-
+    # --- Process each file ---
+    for (group, file), (df, df_clean, static) in zip(group_files, loaded):
         # --- Extract static header rows before the 'Nom'/'Prénom' line ---
         if static_lines is None:
-            for i in range(len(df)):
-                values = df.iloc[i].fillna('').astype(str).str.lower()
-                if "cumul" in values.tolist():
-                    static_lines = df.iloc[:i + 1].dropna(how="all").dropna(axis=1, how="all")
-                    break
+            static_lines = static
 
-        df_clean = clean_and_format(df)
-        df_clean["group"] = group
-        merged_data.append(df_clean)
-
-        cleaned_sheets[group] = df_clean.drop(columns="group", errors='ignore')
-        raw_sheets[group] = df
+        merged_data.append(df_clean.assign(group=group))
+        if context.store_db:  # only the season database reads them
+            cleaned_sheets[group] = df_clean
+        if group in RAW_SHEET_GROUPS:
+            raw_sheets[group] = df
 
     # --- Build merged output ---
     if merged_data:
@@ -106,32 +128,24 @@ def main():
             final_df = final_df.reindex(columns=list(final_df.columns) + extra_cols)
 
 
-        dedup_columns = [col for col in final_df.columns if col != "group"]
-        final_df = final_df.drop_duplicates(subset=dedup_columns)
+        with context.report.stage("oeufs.dedup") as span:
+            dedup_columns = [col for col in final_df.columns if col != "group"]
+            final_df = final_df.drop_duplicates(subset=dedup_columns)
+            span.set_shape(final_df)
 
         # --- Detect and separate static-like rows (inner)
-        def is_static_row(row):
-            vals = row.fillna('').astype(str).str.lower().values
-            return (
-                all(v.strip() == "" for v in vals[:2])  # first columns (name fields) are empty
-                and any(re.match(r"^\d{1,2}-\d{2}$", v) or "vrac" in v or "oeufs" in v for v in vals)
-            )
-
-        inner_static = final_df[final_df.apply(is_static_row, axis=1)]
-        real_data = final_df[~final_df.apply(is_static_row, axis=1)]
+        with context.report.stage("oeufs.classify") as span:
+            real_data = member_rows(final_df, static_row_mask(final_df))
 
-        # Remove any row from real_data already present in static_lines
-        if static_lines is not None:
-            static_tuples = static_lines.apply(tuple, axis=1)
-            real_data = real_data[~real_data.apply(tuple, axis=1).isin(static_tuples)]
+            # Remove any row from real_data already present in static_lines (same cells, same width)
+            if static_lines is not None and static_lines.shape[1] == real_data.shape[1]:
+                real_data = real_data[~np.isin(row_keys(real_data, normalize=False), row_keys(static_lines, normalize=False))]
+            members = member_table(real_data)
+            span.set_shape(members)
 
         # --- Compute cumul only from rows where value == 1
-        valid_rows = real_data[real_data.get("oeufs") == 1]
-        cumul_counts = {
-            col: (valid_rows[col] == 1).sum()
-            for col in ["oeufs"]
-            if col in valid_rows.columns
-        }
+        cumul_counts = subscription_counts(members, ["oeufs"])
+        counts_by_group = group_counts(members, ["oeufs"])
 
         cumul_row = {col: "" for col in final_df.columns}
         cumul_row.update(cumul_counts)
@@ -144,18 +158,22 @@ def main():
 
         # Insert one empty row before cumul and one before headers
         empty_row_df = pd.DataFrame([[""] * final_df.shape[1]], columns=final_df.columns)
-
+    else:
+        print("⚠️ No usable data extracted.")
+        # A previous run's sheet (--watch) must not be written again
+        context.results.pop("oeufs", None)
+        return
 
     # Remove empty rows between cumul and real_data if already present
-    real_data_cleaned = real_data.copy()
+    real_data_cleaned = to_output(members)
 
     # Clean top empty rows
     while not real_data_cleaned.empty and real_data_cleaned.iloc[0].isna().all():
         real_data_cleaned = real_data_cleaned.iloc[1:]
 
 
-    # Compute summary
-    n_boites_per_group = real_data_cleaned.groupby("group")["oeufs"].sum(min_count=1).fillna(0).astype(int)
+    # Compute summary, boxes of 6 per group summed on the typed table
+    n_boites_per_group = members.groupby("group", observed=True)["oeufs"].sum(min_count=1).fillna(0).astype(int)
     n_oeufs = n_boites_per_group * 6
     n_plaques = n_oeufs // 30
     n_restant = n_oeufs % 30
@@ -201,37 +219,15 @@ def main():
 
 
     # Deduplicate static rows again if needed
-    def normalize_row_excluding_group(row, group_col="group"):
-        return tuple(
-            str(x).strip().lower()
-            for i, x in enumerate(row)
-            if pd.notna(x) and str(x).strip() and row.index[i] != group_col
-        )
-
-    reference_rows = set(normalize_row_excluding_group(row) for _, row in static_lines.iterrows())
-    full_merged_dedup = full_merged[~full_merged.apply(
-        lambda row: normalize_row_excluding_group(row) in reference_rows, axis=1
-    )]
-    full_merged_dedup = full_merged_dedup[
-        ~full_merged_dedup.iloc[:, 0].astype(str).str.lower().eq("cumul")
-    ]
-
-    # Keep at most 1 empty row
-    def is_empty_row(row):
-        return all(str(val).strip() == "" for val in row)
-
-    rows = full_merged_dedup.reset_index(drop=True)
-    cleaned_rows = []
-    prev_empty = False
-
-    for i in range(len(rows)):
-        is_empty = is_empty_row(rows.iloc[i])
-        if is_empty and prev_empty:
-            continue  # skip repeated empty rows
-        cleaned_rows.append(rows.iloc[i])
-        prev_empty = is_empty
-
-    full_merged_dedup = pd.DataFrame(cleaned_rows, columns=rows.columns)
+    with context.report.stage("oeufs.static_dedup") as span:
+        full_merged_dedup = full_merged[~np.isin(row_keys(full_merged), row_keys(static_lines))]
+        full_merged_dedup = full_merged_dedup[
+            ~full_merged_dedup.iloc[:, 0].astype(str).str.lower().eq("cumul")
+        ]
+
+        # Keep at most 1 empty row
+        full_merged_dedup = full_merged_dedup[blank_run_mask(full_merged_dedup)]
+        span.set_shape(full_merged_dedup)
 
     full_merged = pd.concat([
         static_lines.reset_index(drop=True),
@@ -244,16 +240,25 @@ def main():
 
 
 
-    output_path = folder / "merged_distributions_oeufs.xlsx"
-    with pd.ExcelWriter(output_path, engine="openpyxl") as writer:
-        full_merged.to_excel(writer, sheet_name="merged", index=False, header=False)
-        for group, raw_df in raw_sheets.items():
-            if group in {"cscb", "four", "mjc"}:
-                raw_sheet_name = f"{group}".replace(" ", "_")[:31]
-                raw_df.to_excel(writer, sheet_name=raw_sheet_name, index=False)
+    # --- Keep outputs in memory for the next stages
+    result = StageResult(cleaned=cleaned_sheets, group_counts=counts_by_group)
+    result.add("merged", full_merged, static_rows=len(static_lines))
+    for group, raw_df in raw_sheets.items():
+        raw_sheet_name = f"{group}".replace(" ", "_")[:31]
+        result.add(raw_sheet_name, raw_df, header=True)
 
-    print(f"✅ File saved: {output_path.name}")
+    if context.keep_intermediate:
+        output_path = folder / "merged_distributions_oeufs.xlsx"
+        result.to_excel(output_path)
+        print(f"✅ File saved: {output_path.name}")
+
+    context.results["oeufs"] = result
+    return result
+
+
+def main():
+    run(PipelineContext(keep_intermediate=True))
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,172 @@
+import multiprocessing
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from pathlib import Path
+from openpyxl import load_workbook
+from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+from pandas.errors import EmptyDataError
+from pandas.io.parsers import TextParser
+
+from instrument import measure
+from layout import detect_layout
+
+def convert_cell(cell):
+    # Same conversions as pandas' openpyxl reader
+    if cell.value is None:
+        return ""
+    elif cell.data_type == TYPE_ERROR:
+        return np.nan
+    elif cell.data_type == TYPE_NUMERIC:
+        val = int(cell.value)
+        if val == cell.value:
+            return val
+        return float(cell.value)
+    return cell.value
+
+
+def stream_sheet_rows(ws) -> list:
+    # Every row down to the last non-empty one, whatever the gaps in between;
+    # empty rows are only counted, their cells are not converted
+    data = []
+    blank_run = 0
+
+    for row in ws.iter_rows():
+        if all(cell.value is None for cell in row):
+            blank_run += 1
+            continue
+        values = [convert_cell(cell) for cell in row]
+        while values and values[-1] == "":
+            values.pop()
+        data.extend([] for _ in range(blank_run))
+        data.append(values)
+        blank_run = 0
+
+    # Pad every row to the same width
+    if data:
+        width = max(len(values) for values in data)
+        data = [values + [""] * (width - len(values)) for values in data]
+    return data
+
+
+def rows_to_frame(data: list) -> pd.DataFrame:
+    # Same typing as pd.read_excel(file, header=None)
+    try:
+        return TextParser(data, header=None, skip_blank_lines=False).read()
+    except EmptyDataError:
+        return pd.DataFrame()
+
+
+def read_contract_sheets(file: Path, sheet_names: list) -> dict:
+    # {sheet name: DataFrame} for every requested week, opening the workbook only once.
+    # A missing tab falls back on the first sheet.
+    if Path(file).suffix.lower() == ".xls":
+        with pd.ExcelFile(file, engine="xlrd") as xls:
+            return {
+                name: xls.parse(name if name in xls.sheet_names else 0, header=None)
+                for name in sheet_names
+            }
+
+    # Read-only mode: only the requested tabs are streamed
+    frames = {}
+    by_title = {}
+    wb = load_workbook(file, read_only=True, data_only=True, keep_links=False)
+    try:
+        for name in sheet_names:
+            ws = wb[name] if name in wb.sheetnames else wb.worksheets[0]
+            if ws.title not in by_title:
+                ws.reset_dimensions()
+                by_title[ws.title] = rows_to_frame(stream_sheet_rows(ws))
+            frames[name] = by_title[ws.title]
+    finally:
+        wb.close()
+    return frames
+
+
+def read_contract_sheet(file: Path, sheet_name: str) -> pd.DataFrame:
+    return read_contract_sheets(file, [sheet_name])[sheet_name]
+
+
+def load_group_sheet(file: Path, sheet_names: list, clean, keep_raw: bool = True) -> tuple:
+    # ({sheet name: (raw, cleaned, static lines)}, timing spans); a sheet that cannot be
+    # cleaned keeps its error, which is only raised when that week is actually asked for.
+    # `clean(df, layout)` gets the layout also used for the static lines (None without a
+    # "cumul" line). Without `keep_raw`, raw is None: the frame is dropped once cleaned.
+    spans = []
+    with measure("read_workbook", Path(file).name) as span:
+        frames = read_contract_sheets(file, sheet_names)
+        span.rows = sum(len(df) for df in frames.values())
+        span.cols = max((df.shape[1] for df in frames.values()), default=0)
+    spans.append(span)
+
+    loaded = {}
+    for name, df in frames.items():
+        with measure("clean_and_format", f"{Path(file).name} [{name}]") as span:
+            try:
+                layout = detect_layout(df)
+                loaded[name] = (df if keep_raw else None, clean(df, layout), layout.static_block(df))
+                span.set_shape(loaded[name][1])
+            except ValueError as e:
+                loaded[name] = e
+                span.error = str(e)
+        spans.append(span)
+    return loaded, spans
+
+
+def load_group_sheets(files: list, sheet_name: str, clean, workers: int = 1, cache=None, season=None,
+                      report=None, keep_raw: set = None) -> list:
+    # Returns (raw, cleaned, static lines) in the order of `files`, whatever the number of workers.
+    # `clean` must be a module-level function so it can be sent to the worker processes.
+    # In a season run, the other weeks' tabs are read in the same pass and kept in
+    # `season.loaded` until their Saturday comes.
+    # `keep_raw`: the files whose raw frames are needed (all by default); for the
+    # others raw is None, so they are neither sent back, cached nor kept for the season.
+    keep = [keep_raw is None or file in keep_raw for file in files]
+    # Entries without raw frames have their own cache key
+    clean_ids = [
+        (clean.__module__, clean.__qualname__) + (() if kept else ("no-raw",))
+        for kept in keep
+    ]
+    loaded = [None] * len(files)
+    if season is not None:
+        for i, file in enumerate(files):
+            loaded[i] = season.loaded.pop((file, sheet_name, clean_ids[i]), None)
+
+    if cache is not None:
+        for i, file in enumerate(files):
+            if loaded[i] is None:
+                loaded[i] = cache.get(cache.key(file, sheet_name, *clean_ids[i]))
+
+    missing = [i for i, value in enumerate(loaded) if value is None]
+    misses = [files[i] for i in missing]
+    sheet_names = [sheet_name]
+    if season is not None:
+        # Only the weeks still to come, earlier ones are already done
+        sheet_names += [name for name in season.sheet_names if name > sheet_name]
+
+    keep_misses = [keep[i] for i in missing]
+    if workers <= 1 or len(misses) <= 1:
+        parsed = [load_group_sheet(file, sheet_names, clean, kept) for file, kept in zip(misses, keep_misses)]
+    else:
+        # Started from a stage thread: spawned rather than forked, a fork could copy a
+        # lock held by another stage and hang the worker
+        with ProcessPoolExecutor(max_workers=min(workers, len(misses)),
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            parsed = list(pool.map(load_group_sheet, misses, repeat(sheet_names), repeat(clean), keep_misses))
+
+    for i, (sheets, spans) in zip(missing, parsed):
+        file = files[i]
+        if report is not None:
+            report.add(spans)
+        for name, value in sheets.items():
+            if cache is not None and not isinstance(value, Exception):
+                cache.put(cache.key(file, name, *clean_ids[i]), value)
+            if name != sheet_name and season is not None:
+                season.loaded[(file, name, clean_ids[i])] = value
+        loaded[i] = sheets[sheet_name]
+
+    for value in loaded:
+        if isinstance(value, Exception):
+            raise value
+    return loaded
@@ -0,0 +1,100 @@
+import json
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows: no peak RSS
+    resource = None
+
+REPORT_FILE = "run_report.json"
+SUMMARY_FILE = "run_report.txt"
+
+
+def peak_rss_mb() -> float:
+    # High-water mark of this process' memory so far
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+# One measured step of a run
+@dataclass
+class Span:
+    name: str
+    detail: str = ""  # file, sheet...
+    wall_s: float = 0.0
+    cpu_s: float = 0.0
+    peak_rss_mb: float = None
+    rows: int = None
+    cols: int = None
+    error: str = None
+
+    def set_shape(self, df):
+        if df is not None:
+            self.rows, self.cols = df.shape
+
+
+@contextmanager
+def measure(name: str, detail: str = ""):
+    # Times the block; usable without a report (e.g. in worker processes). The CPU
+    # time is the current thread's, stages running at the same time are not counted
+    span = Span(name, str(detail))
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield span
+    except Exception as e:
+        span.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        span.wall_s = round(time.perf_counter() - wall, 4)
+        span.cpu_s = round(time.thread_time() - cpu, 4)
+        span.peak_rss_mb = peak_rss_mb()
+
+
+# Spans of one run, in the order they finished
+@dataclass
+class RunReport:
+    spans: list = field(default_factory=list)
+    started: datetime = field(default_factory=datetime.now)
+
+    @contextmanager
+    def stage(self, name: str, detail: str = ""):
+        with measure(name, detail) as span:
+            try:
+                yield span
+            finally:
+                self.spans.append(span)
+
+    def add(self, spans: list):
+        self.spans.extend(spans)
+
+    def summary(self) -> str:
+        lines = [f"{'step':<22} {'detail':<72} {'wall s':>8} {'cpu s':>8} {'rss MB':>8} {'rows':>11}"]
+        for s in self.spans:
+            shape = "" if s.rows is None else f"{s.rows}" if s.cols is None else f"{s.rows}x{s.cols}"
+            rss = "" if s.peak_rss_mb is None else f"{s.peak_rss_mb:.1f}"
+            line = f"{s.name:<22} {s.detail[:72]:<72} {s.wall_s:8.3f} {s.cpu_s:8.3f} {rss:>8} {shape:>11}"
+            if s.error:
+                line += f"  ❌ {s.error.splitlines()[0]}"
+            lines.append(line)
+        return "\n".join(lines)
+
+    def write(self, folder: Path, date_str: str, summary: bool = False) -> Path:
+        folder.mkdir(parents=True, exist_ok=True)
+        path = folder / REPORT_FILE
+        report = {
+            "date": date_str,
+            "started": self.started.isoformat(timespec="seconds"),
+            "spans": [asdict(s) for s in self.spans],
+        }
+        path.write_text(json.dumps(report, ensure_ascii=False, indent=1), encoding="utf-8")
+        if summary:
+            (folder / SUMMARY_FILE).write_text(self.summary() + "\n", encoding="utf-8")
+        return path
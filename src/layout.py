@@ -0,0 +1,89 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+# The 'Nom'/'Prénom' header is looked for in the first rows of the sheet only
+HEADER_SEARCH_ROWS = 10
+HEADER_CELLS = ["nom", "prénom"]
+
+
+# Where things are in a contract sheet, found in one pass over its cells.
+# Row/column numbers are positions in the raw sheet.
+@dataclass
+class SheetLayout:
+    lowered: np.ndarray  # cell text, lower-cased ("" for empty cells)
+    missing: np.ndarray  # empty (NaN) cells
+    header_row: int = None  # the 'Nom'/'Prénom' line
+    cumul_row: int = None  # first line with a "cumul" cell, end of the static lines
+
+    @property
+    def empty_rows(self) -> np.ndarray:
+        return self.missing.all(axis=1)
+
+    @property
+    def empty_cols(self) -> np.ndarray:
+        return self.missing.all(axis=0)
+
+    def static_block(self, df: pd.DataFrame) -> pd.DataFrame:
+        # Lines above and including the "cumul" one, without empty rows/columns
+        if self.cumul_row is None:
+            return None
+        filled = ~self.missing[:self.cumul_row + 1]
+        return df.iloc[np.flatnonzero(filled.any(axis=1)), np.flatnonzero(filled.any(axis=0))]
+
+
+def lowered_cells(df: pd.DataFrame) -> np.ndarray:
+    cells = pd.Series(df.to_numpy(dtype=object).ravel())
+    text = cells.astype(str).str.lower().where(cells.notna(), "")
+    return text.to_numpy(dtype=object).reshape(df.shape)
+
+
+def first_row(mask: np.ndarray) -> int:
+    rows = np.flatnonzero(mask)
+    return int(rows[0]) if len(rows) else None
+
+
+def detect_layout(df: pd.DataFrame) -> SheetLayout:
+    lowered = lowered_cells(df)
+    missing = df.isna().to_numpy()
+
+    # Header: among the first non-empty rows only
+    is_header = np.isin(lowered, HEADER_CELLS).any(axis=1)
+    candidates = np.flatnonzero(~missing.all(axis=1))[:HEADER_SEARCH_ROWS]
+    header_row = first_row(is_header[candidates])
+    if header_row is not None:
+        header_row = int(candidates[header_row])
+
+    cumul_row = first_row((lowered == "cumul").any(axis=1))
+    return SheetLayout(lowered, missing, header_row, cumul_row)
+
+
+def header_table(df: pd.DataFrame, layout: SheetLayout) -> pd.DataFrame:
+    # Member block of a sheet: the rows under the header, named after it, without
+    # empty rows/columns nor the previous "Cumul" lines
+    if layout.header_row is None:
+        raise ValueError("No usable header row found (no 'Nom' or 'Prénom').")
+
+    cols = np.flatnonzero(~layout.empty_cols)
+    rows = np.flatnonzero(~layout.empty_rows)
+    rows = rows[rows > layout.header_row]
+
+    # Remove previous "Cumul" rows (checked on the first column); the index
+    # keeps counting the member block lines
+    keep = np.ones(len(rows), dtype=bool)
+    if len(cols):
+        keep = ~pd.Series(layout.lowered[rows, cols[0]]).str.contains("cumul", regex=False).to_numpy(dtype=bool)
+
+    table = df.iloc[rows[keep], cols]
+    table.index = np.flatnonzero(keep)
+    table.columns = df.iloc[layout.header_row, cols].fillna('').astype(str).str.strip()
+
+    # Ensure column names are unique
+    table.columns = table.columns.astype(str)
+    if table.columns.duplicated().any():
+        table.columns = [
+            f"{col}_{i}" if table.columns.duplicated()[i] else col
+            for i, col in enumerate(table.columns)
+        ]
+    return table
@@ -1,68 +1,252 @@
-import subprocess
-import pandas as pd
+import argparse
+import shutil
+from datetime import date
+from functools import partial
 from pathlib import Path
-from datetime import datetime, timedelta
 
-def run_extractors():
-    print("Extraction des fichiers oeufs...")
-    subprocess.run(["python", "src/extractor_oeufs.py"], check=True)
+import extractor_oeufs
+import extractor_legumes
+import extract_permanences
+import export_pdf
+import season_db
+import watch
+from cache import MemoryCache, ParseCache
+from discover import FILE_PATTERNS
+from excel_writer import write_sheets
+from instrument import RunReport
+from manifest import OutputManifest, fingerprint
+from pipeline import PipelineContext, Season, get_next_saturday, saturdays_between
+from scheduler import Stage, StagesFailed, run_stages
 
-    print("Extraction des fichiers legumes...")
-    subprocess.run(["python", "src/extractor_legumes.py"], check=True)
+# Each stage exposes run(context), executed in this process, and stores its
+# result in context.results under the given name
+EXTRACTION_STAGES = [
+    ("Extraction des fichiers oeufs...", "oeufs", extractor_oeufs),
+    ("Extraction des fichiers legumes...", "legumes", extractor_legumes),
+    ("Extraction de la liste des permanences...", "permanences", extract_permanences),
+]
 
-    print("Extraction de la liste des permanences...")
-    subprocess.run(["python", "src/extract_permanences.py"], check=True)
+# The pdf only reads the contract sheets
+PDF_INPUTS = ("oeufs", "legumes")
 
-def run_pdfs():
-    print("Generating pdf...")
-    subprocess.run(["python", "src/export_pdf.py"], check=True)
+def run_extractor(label: str, name: str, stage, context: PipelineContext):
+    print(label)
+    with context.report.stage(name) as span:
+        stage.run(context)
+        result = context.results.get(name)
+        if result is not None:
+            span.set_shape(result.sheets["merged"].df)
+
+def run_extractors(context: PipelineContext, only: set = None):
+    # `only`: names of the stages to (re)run, all of them by default
+    for label, name, stage in EXTRACTION_STAGES:
+        if only is None or name in only:
+            run_extractor(label, name, stage, context)
 
+def run_pdfs(context: PipelineContext) -> list:
+    print("Generating pdf...")
+    with context.report.stage("pdf"):
+        return export_pdf.run(context, read_xlsx=False)
 
-def get_next_saturday_sheetname():
-    today = datetime.today()
-    days_until_saturday = (5 - today.weekday()) % 7
-    saturday = today + timedelta(days=days_until_saturday)
-    return saturday.strftime("%Y-%m-%d")
 
-def combine_outputs():
-    merged_files = {
-        "merged_distributions_permanences.xlsx": "permanences",
-        "merged_distributions_oeufs.xlsx": "oeufs",
-        "merged_distributions_legumes.xlsx": "legumes"
-    }
+def combine_outputs(context: PipelineContext) -> list:
+    # Sheet prefix per stage, in workbook order
+    sheet_prefixes = ["permanences", "oeufs", "legumes"]
 
-    output_path = Path(f"distrib_amap_{get_next_saturday_sheetname()}.xlsx")
+    output_path = context.folder / f"distrib_amap_{context.date_str}.xlsx"
 
-    with pd.ExcelWriter(output_path, engine="openpyxl") as writer:
-        for file, sheet_prefix in merged_files.items():
-            path = Path(file)
-            if not path.exists():
-                print(f"⚠️ Missing file: {file}")
-                continue
+    sheets = {}
+    for sheet_prefix in sheet_prefixes:
+        result = context.results.get(sheet_prefix)
+        if result is None:
+            print(f"⚠️ Missing result: {sheet_prefix}")
+            continue
 
-            # Use context manager to ensure ExcelFile is closed
-            with pd.ExcelFile(path) as xls:
-                for sheet_name in xls.sheet_names:
-                    df = xls.parse(sheet_name, header=None)
-                    sheet_base = sheet_name.replace("merged_", "")[:25]
-                    
-                    df.to_excel(writer, sheet_name=f"{sheet_prefix}_{sheet_base}", index=False, header=False)
+        for sheet_name, sheet in result.sheets.items():
+            sheet_base = sheet_name.replace("merged_", "")[:25]
+            sheets[f"{sheet_prefix}_{sheet_base}"] = sheet
 
+    with context.report.stage("write_excel", output_path.name) as span:
+        write_sheets(output_path, sheets)
+        span.rows = sum(len(sheet.df) for sheet in sheets.values())
 
     print(f"✅ Final file saved: {output_path.name}")
+    return [output_path]
+
+def archive_files(folder: Path, name: str):
+    # Move the week's workbooks (inputs and outputs) and the pdf to a folder named after the Saturday
+    archive_dir = folder / name
+    archive_dir.mkdir(exist_ok=True)
+
+    print(f"Moving .xls, .xlsx and .pdf files to {archive_dir.name}/")
+    for pattern in ("*.xls", "*.xlsx", "*.pdf"):
+        for path in folder.glob(pattern):
+            shutil.move(str(path), str(archive_dir / path.name))
+
+def run_output(manifest: OutputManifest, name: str, fingerprint: str, run, inputs: tuple, context: PipelineContext):
+    # Output stage remembering what its files were made from, once complete
+    manifest.forget(name)
+    files = run(context)
+    if files and all(stage in context.results for stage in inputs):
+        manifest.record(name, fingerprint, files)
+
+def reuse_output(manifest: OutputManifest, name: str, context: PipelineContext):
+    manifest.reuse(name)
+
+def week_stages(context: PipelineContext, only: set = None) -> list:
+    # Extractors first, then the outputs; independent stages run at the same time.
+    # Outputs whose inputs did not change since the last run are reused (unless
+    # --no-cache) and extractors only run when a stage still needs their results.
+    # `only`: the extractors to rerun, the others' results are kept when there are some.
+    manifest = OutputManifest(context.folder, context.date_str)
+    extractors = tuple(name for _, name, _ in EXTRACTION_STAGES)
+    inputs = context.input_files()
+    files = {name: inputs.paths(name) for name in extractors}
+
+    def inputs_fingerprint(inputs: tuple, **params) -> str:
+        return fingerprint([f for name in inputs for f in files[name]], date=context.date_str, **params)
+
+    outputs = [
+        ("combine", combine_outputs, extractors, inputs_fingerprint(extractors)),
+        ("pdf", run_pdfs, PDF_INPUTS, inputs_fingerprint(
+            PDF_INPUTS, renderer=export_pdf.pick_renderer(context.pdf_renderer), per_group=context.pdf_per_group)),
+    ]
+    stages, needed = [], set()
+    if context.store_db:
+        stages.append(Stage("season_db", season_db.run, extractors))
+        needed.update(extractors)
+    if context.keep_intermediate:
+        needed.update(extractors)
+    for name, run, inputs, output_fingerprint in outputs:
+        if context.use_cache and manifest.reusable(name, output_fingerprint):
+            stages.append(Stage(name, partial(reuse_output, manifest, name)))
+        else:
+            stages.append(Stage(name, partial(run_output, manifest, name, output_fingerprint, run, inputs), inputs))
+            needed.update(inputs)
+
+    extraction = [
+        Stage(name, partial(run_extractor, label, name, stage))
+        for label, name, stage in EXTRACTION_STAGES
+        if name in needed and (only is None or name in only or name not in context.results)
+    ]
+    return extraction + stages
 
-    # Now we can safely delete the files
-    for f in merged_files:
+def run_week(context: PipelineContext, report_summary: bool = False, only: set = None):
+    # A failed stage is reported once the others are done, their files are still written.
+    # The run report goes to the Saturday's archive folder, even when a step fails
+    try:
+        errors = run_stages(week_stages(context, only), context)
+        if errors:
+            raise StagesFailed(errors)
+    finally:
+        path = context.report.write(context.folder / context.date_str, context.date_str, report_summary)
+        print(f"Run report: {path}")
+
+def run_season(dates: list, report_summary: bool = False, **options) -> list:
+    # One distrib_amap_<date>.xlsx/pdf per Saturday; the workbooks are read only once
+    season = Season(dates)
+    inputs = None  # the folder is scanned for the first Saturday only
+    failed = []
+    for target_date in dates:
+        print(f"=== {target_date:%Y-%m-%d} ===")
+        context = PipelineContext(target_date=target_date, season=season, inputs=inputs, **options)
+        try:
+            inputs = context.input_files()
+            run_week(context, report_summary)
+        except Exception as e:
+            print(f"❌ {target_date:%Y-%m-%d} failed: {e}")
+            failed.append(target_date)
+    return failed
+
+def run_watch(report_summary: bool = False, interval: float = 2.0, debounce: float = 3.0, **options):
+    # Keeps the week's results and parsed workbooks in memory and, when input files
+    # change, re-runs only the stages reading them before refreshing the xlsx/pdf
+    memory = MemoryCache(ParseCache(Path('.')) if options["use_cache"] else None)
+    state = {}
+
+    def on_change(stages, inputs):
+        # `inputs`: the watcher's last scan of the folder, reused by the stages
+        context = state.get("context")
+        target_date = get_next_saturday()
+        if stages is None or context is None or context.target_date != target_date:
+            context = PipelineContext(target_date=target_date, memory=memory, **options)
+            stages = None
+        else:
+            context.report = RunReport()
+        context.inputs = inputs
+        print(f"🔄 {context.date_str}: {', '.join(sorted(stages)) if stages else 'all stages'}")
         try:
-            Path(f).unlink()
-            # print(f"🗑️ Deleted: {f}")
+            run_week(context, report_summary, stages)
         except Exception as e:
-            print(f"❌ Could not delete {f}: {e}")
+            print(f"❌ Refresh failed: {e}")
+            context = None  # start from scratch on the next change
+        state["context"] = context
+        print("👀 Watching for changes (Ctrl+C to stop)...")
+
+    try:
+        watch.watch(Path('.'), FILE_PATTERNS, on_change, interval, debounce)
+    except KeyboardInterrupt:
+        print("Stopped.")
 
 def main():
-    run_extractors()
-    combine_outputs()
-    run_pdfs()
+    parser = argparse.ArgumentParser(description="Génère les listes de distribution de la semaine")
+    parser.add_argument("--keep-intermediate", action="store_true",
+                        help="also write the merged_distributions_*.xlsx files (debug)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of processes reading the group workbooks (default: 1)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="re-read every workbook instead of using the parse cache")
+    parser.add_argument("--archive", action="store_true",
+                        help="move the .xls/.xlsx/.pdf files to a folder named after the Saturday when done")
+    parser.add_argument("--to-db", action="store_true",
+                        help=f"also store the cleaned contract rows and permanences in {season_db.DB_FILE}")
+    parser.add_argument("--report-summary", action="store_true",
+                        help="also write a readable run_report.txt next to the JSON run report")
+    parser.add_argument("--from", dest="start", type=date.fromisoformat, metavar="YYYY-MM-DD",
+                        help="build every Saturday from this date (season mode, use with --to)")
+    parser.add_argument("--to", dest="end", type=date.fromisoformat, metavar="YYYY-MM-DD",
+                        help="last day of the season mode range")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and refresh the week's files whenever an input workbook changes")
+    parser.add_argument("--debounce", type=float, default=3.0,
+                        help="seconds without further changes before refreshing in --watch mode (default: 3)")
+    parser.add_argument("--pdf-renderer", choices=["auto", *export_pdf.RENDERERS], default="auto",
+                        help="builtin: pdf written directly, pdfkit: html printed by wkhtmltopdf "
+                             "(default: pdfkit when wkhtmltopdf is installed)")
+    parser.add_argument("--pdf-per-group", action="store_true",
+                        help="also write one pdf per distribution group, with only its members (rendered in parallel)")
+    args = parser.parse_args()
+
+    options = dict(
+        keep_intermediate=args.keep_intermediate,
+        workers=args.workers,
+        use_cache=not args.no_cache,
+        store_db=args.to_db,
+        pdf_renderer=args.pdf_renderer,
+        pdf_per_group=args.pdf_per_group,
+    )
+
+    if args.watch:
+        run_watch(args.report_summary, debounce=args.debounce, **options)
+        return
+
+    if args.start is None and args.end is None:
+        context = PipelineContext(**options)
+        run_week(context, args.report_summary)
+        if args.archive:
+            archive_files(context.folder, context.date_str)
+        return
+
+    if args.start is None or args.end is None:
+        parser.error("--from and --to go together")
+    dates = saturdays_between(args.start, args.end)
+    if not dates:
+        parser.error("no Saturday in the given range")
+
+    failed = run_season(dates, args.report_summary, **options)
+    print(f"✅ {len(dates) - len(failed)}/{len(dates)} Saturdays built")
+    if args.archive:
+        archive_files(Path('.'), f"{dates[0]:%Y-%m-%d}_{dates[-1]:%Y-%m-%d}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,84 @@
+import hashlib
+import json
+import shutil
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+from cache import file_digest
+
+# Kept in the Saturday's folder, next to the run report
+MANIFEST_FILE = "outputs_manifest.json"
+
+
+@lru_cache(maxsize=None)
+def code_version() -> str:
+    # Digest of the scripts: files written by another version are never reused
+    h = hashlib.sha256()
+    for path in sorted(Path(__file__).parent.glob("*.py")):
+        h.update(path.read_bytes())
+    return h.hexdigest()
+
+
+def fingerprint(files: list, **params) -> str:
+    # Content of the input files, the options the output depends on and the code version
+    h = hashlib.sha256(code_version().encode())
+    for path in sorted(files):
+        h.update(f"\0{Path(path).name}\0{file_digest(path)}".encode())
+    for key, value in sorted(params.items()):
+        h.update(f"\0{key}={value}".encode())
+    return h.hexdigest()
+
+
+# Fingerprint and files of every output stage of the last run for one Saturday.
+# Outputs are looked for next to the inputs, then in the Saturday's folder
+# (where --archive moves them).
+class OutputManifest:
+    def __init__(self, folder: Path, date_str: str):
+        self.folder = Path(folder)
+        self.archive = self.folder / date_str
+        self.path = self.archive / MANIFEST_FILE
+        self.entries = {}  # stage -> {"fingerprint": ..., "files": [names]}
+        self.lock = threading.Lock()  # stages record their outputs at the same time
+        if self.path.exists():
+            try:
+                self.entries = json.loads(self.path.read_text(encoding="utf-8"))
+            except Exception as e:
+                print(f"⚠️ Ignoring unreadable {self.path.name}: {e}")
+
+    def locate(self, name: str) -> Path:
+        for folder in (self.folder, self.archive):
+            if (folder / name).exists():
+                return folder / name
+        return None
+
+    def reusable(self, stage: str, fingerprint: str) -> bool:
+        entry = self.entries.get(stage)
+        if entry is None or entry["fingerprint"] != fingerprint:
+            return False
+        return all(self.locate(name) is not None for name in entry["files"])
+
+    def reuse(self, stage: str):
+        # Archived outputs are copied back next to the inputs, where a new run writes them
+        for name in self.entries[stage]["files"]:
+            path = self.locate(name)
+            if path.parent != self.folder:
+                shutil.copy2(path, self.folder / name)
+            print(f"✅ {name} unchanged since the last run, reused")
+
+    def forget(self, stage: str):
+        # Before regenerating: a run failing halfway must not leave a matching entry
+        with self.lock:
+            if self.entries.pop(stage, None) is not None:
+                self.save()
+
+    def record(self, stage: str, fingerprint: str, files: list):
+        with self.lock:
+            self.entries[stage] = {"fingerprint": fingerprint, "files": [Path(f).name for f in files]}
+            self.save()
+
+    def save(self):
+        self.archive.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.entries, indent=1), encoding="utf-8")
+        tmp.replace(self.path)
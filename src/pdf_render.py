@@ -0,0 +1,157 @@
+import io
+import unicodedata
+import zlib
+
+# Minimal PDF writer for the distribution tables: text in the standard Helvetica
+# fonts (no font file to embed) and cell borders, built in memory.
+
+PAGE_WIDTH, PAGE_HEIGHT = 595.28, 841.89  # A4, in points
+MARGIN = 36
+TITLE_SIZE = 14
+FONT_SIZE = 9  # the 12px of the html version
+MIN_FONT_SIZE = 5  # wide tables are shrunk down to this size, then cells are cut
+PADDING = 3
+LINE_WIDTH = 0.75
+
+# Helvetica advance widths (1/1000 of the font size) of the characters 32 to 126
+ASCII_WIDTHS = (
+    [278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278]
+    + [556] * 10
+    + [278, 278, 584, 584, 584, 556, 1015]
+    + [667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833,
+       722, 778, 667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611]
+    + [278, 278, 278, 469, 556, 333]
+    + [556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833,
+       556, 556, 556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500]
+    + [334, 260, 334, 584]
+)
+OTHER_WIDTHS = {"œ": 944, "Œ": 1000, "…": 1000, "’": 222, "°": 400}
+ELLIPSIS = "…"
+
+
+def char_width(c: str) -> int:
+    code = ord(c)
+    if 32 <= code < 127:
+        return ASCII_WIDTHS[code - 32]
+    if c in OTHER_WIDTHS:
+        return OTHER_WIDTHS[c]
+    # Accented letters are as wide as the plain one
+    base = unicodedata.normalize("NFKD", c)[:1]
+    if base != c and 32 <= ord(base) < 127:
+        return ASCII_WIDTHS[ord(base) - 32]
+    return 556
+
+
+def text_width(text: str, size: float) -> float:
+    return sum(char_width(c) for c in text) * size / 1000
+
+
+def fit(text: str, width: float, size: float) -> str:
+    # Cut the text (with an ellipsis) when it is wider than the cell
+    if text_width(text, size) <= width:
+        return text
+    while text and text_width(text + ELLIPSIS, size) > width:
+        text = text[:-1]
+    return text + ELLIPSIS if text else ""
+
+
+def pdf_string(text: str) -> bytes:
+    # The standard fonts are used with the WinAnsi encoding (cp1252: accents, œ, €)
+    data = text.encode("cp1252", errors="replace")
+    return b"(" + data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+# Pages as lists of drawing operators, serialized by to_bytes()
+class PdfDocument:
+    FONTS = {"F1": "Helvetica", "F2": "Helvetica-Bold"}
+
+    def __init__(self):
+        self.pages = []
+
+    def new_page(self):
+        self.pages.append([b"%.2f w" % LINE_WIDTH])
+
+    def text(self, x: float, y: float, text: str, size: float, font: str = "F1"):
+        self.pages[-1].append(b"BT /%s %.2f Tf %.2f %.2f Td %s Tj ET" % (font.encode(), size, x, y, pdf_string(text)))
+
+    def rect(self, x: float, y: float, width: float, height: float):
+        self.pages[-1].append(b"%.2f %.2f %.2f %.2f re S" % (x, y, width, height))
+
+    def to_bytes(self) -> bytes:
+        if not self.pages:
+            self.new_page()
+        # 1: catalog, 2: page tree, then the fonts, then each page and its content
+        objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None]
+        fonts = []
+        for name, base_font in self.FONTS.items():
+            objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>" % base_font.encode())
+            fonts.append(b"/%s %d 0 R" % (name.encode(), len(objects)))
+
+        kids = []
+        for operators in self.pages:
+            page_id = len(objects) + 1
+            kids.append(b"%d 0 R" % page_id)
+            objects.append(
+                b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] /Resources << /Font << %s >> >> /Contents %d 0 R >>"
+                % (PAGE_WIDTH, PAGE_HEIGHT, b" ".join(fonts), page_id + 1)
+            )
+            stream = zlib.compress(b"\n".join(operators))
+            objects.append(b"<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), len(kids))
+
+        out = io.BytesIO()
+        out.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        offsets = []
+        for i, body in enumerate(objects, 1):
+            offsets.append(out.tell())
+            out.write(b"%d 0 obj\n%s\nendobj\n" % (i, body))
+        xref = out.tell()
+        out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        out.write(b"".join(b"%010d 00000 n \n" % offset for offset in offsets))
+        out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+        return out.getvalue()
+
+
+def column_widths(rows: list, available: float) -> tuple:
+    # Columns share the page width in proportion to their widest cell (like the
+    # html "width: 100%" table); too wide tables get a smaller font
+    n_cols = max((len(cells) for cells in rows), default=0)
+    natural = [2 * PADDING] * n_cols
+    for cells in rows:
+        for i, text in enumerate(cells):
+            natural[i] = max(natural[i], text_width(text, FONT_SIZE) + 2 * PADDING)
+    total = sum(natural)
+    if not total:
+        return [], FONT_SIZE
+    size = min(FONT_SIZE, max(MIN_FONT_SIZE, FONT_SIZE * available / total))
+    return [w * available / total for w in natural], size
+
+
+def render_tables(tables: list) -> bytes:
+    # tables: (title, rows of cell texts, bordered flag of each row), one per page
+    # break; long tables continue on the next pages
+    doc = PdfDocument()
+    for title, rows, bordered in tables:
+        # Whitespace collapses as in html
+        rows = [[" ".join(text.split()) for text in cells] for cells in rows]
+        doc.new_page()
+        y = PAGE_HEIGHT - MARGIN - TITLE_SIZE
+        doc.text(MARGIN, y, title, TITLE_SIZE, "F2")
+        y -= TITLE_SIZE / 2
+
+        widths, size = column_widths(rows, PAGE_WIDTH - 2 * MARGIN)
+        row_height = size * 1.2 + 2 * PADDING
+        for cells, border in zip(rows, bordered):
+            if y - row_height < MARGIN:
+                doc.new_page()
+                y = PAGE_HEIGHT - MARGIN
+            y -= row_height
+            x = MARGIN
+            for text, width in zip(cells, widths):
+                if border:
+                    doc.rect(x, y, width, row_height)
+                text = fit(text, width - 2 * PADDING, size)
+                if text:
+                    doc.text(x + PADDING, y + PADDING + size * 0.3, text, size)
+                x += width
+    return doc.to_bytes()
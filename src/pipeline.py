@@ -0,0 +1,117 @@
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+from cache import MemoryCache, ParseCache
+from discover import FileManifest, scan
+from excel_writer import write_sheets
+from instrument import RunReport
+
+
+def get_next_saturday(today: date = None) -> date:
+    today = today or datetime.today().date()
+    days_until_saturday = (5 - today.weekday()) % 7
+    return today + timedelta(days=days_until_saturday)
+
+
+def saturdays_between(start: date, end: date) -> list:
+    saturdays = []
+    day = get_next_saturday(start)
+    while day <= end:
+        saturdays.append(day)
+        day += timedelta(weeks=1)
+    return saturdays
+
+
+# One output sheet kept in memory, with what the writers need to lay it out
+@dataclass
+class SheetOutput:
+    df: pd.DataFrame
+    header: bool = False  # write column names as the first row
+    static_rows: int = 0  # number of static title lines at the top of the sheet
+    row_styles: pd.DataFrame = None  # per-row "border"/"fill" flags, when the sheet is styled
+
+
+# Groups whose raw contract sheet is copied to the output workbook
+RAW_SHEET_GROUPS = {"cscb", "four", "mjc"}
+
+
+# Sheets produced by one extraction stage, in output order
+@dataclass
+class StageResult:
+    sheets: dict = field(default_factory=dict)
+    # Cleaned rows of each group workbook, before merging (contract stages with
+    # --to-db only, for season_db)
+    cleaned: dict = field(default_factory=dict)
+    # Subscriptions taken this week by each group, {group: {column: count}}; the typed
+    # member table (see schema.py) they come from is not kept
+    group_counts: dict = field(default_factory=dict)
+
+    def add(self, name: str, df: pd.DataFrame, **style):
+        self.sheets[name] = SheetOutput(df, **style)
+
+    def to_excel(self, path: Path):
+        write_sheets(path, self.sheets)
+
+
+# Saturdays built by one batch run. Every workbook is read once for all of them;
+# what has been read but not used yet waits in `loaded`.
+@dataclass
+class Season:
+    dates: list
+    loaded: dict = field(default_factory=dict)
+
+    @property
+    def sheet_names(self) -> list:
+        return [d.strftime("%Y-%m-%d") for d in self.dates]
+
+
+# Shared state handed to every stage's run(context)
+@dataclass
+class PipelineContext:
+    folder: Path = Path('.')
+    target_date: date = field(default_factory=get_next_saturday)
+    # Also write merged_distributions_*.xlsx (debug artifacts)
+    keep_intermediate: bool = False
+    # Worker processes used to read the group workbooks (1 = sequential)
+    workers: int = 1
+    # Reuse parsed workbooks from the on-disk cache
+    use_cache: bool = True
+    # Also store the week's cleaned rows in the season database
+    store_db: bool = False
+    # Set when several Saturdays are built in the same run
+    season: Season = None
+    # Parsed workbooks kept in memory between refreshes (watch mode)
+    memory: MemoryCache = None
+    # How the pdf is rendered: "auto", "builtin" or "pdfkit" (see export_pdf.RENDERERS)
+    pdf_renderer: str = "auto"
+    # Also write one pdf per distribution group (distrib_amap_<date>_<group>.pdf)
+    pdf_per_group: bool = False
+    # How input files are recognized (None: discover.FILE_PATTERNS)
+    file_patterns: dict = None
+    # Input workbooks of the folder, see input_files()
+    inputs: FileManifest = None
+    # Stage results by sheet prefix ("oeufs", "legumes", "permanences")
+    results: dict = field(default_factory=dict)
+    # Timings of every step of the run
+    report: RunReport = field(default_factory=RunReport)
+
+    @property
+    def date_str(self) -> str:
+        return self.target_date.strftime("%Y-%m-%d")
+
+    def input_files(self) -> FileManifest:
+        # The folder is scanned once, every stage picks its files from the same list
+        if self.inputs is None:
+            with self.report.stage("discover") as span:
+                self.inputs = scan(self.folder, self.file_patterns)
+                span.rows = len(self.inputs.files)
+        return self.inputs
+
+    @property
+    def cache(self):
+        if self.memory is not None:
+            return self.memory
+        return ParseCache(self.folder) if self.use_cache else None
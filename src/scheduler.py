@@ -0,0 +1,44 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+
+
+# A step of the run and the steps whose results it reads
+@dataclass
+class Stage:
+    name: str
+    run: object  # run(context)
+    after: tuple = ()
+
+
+class StagesFailed(Exception):
+    def __init__(self, errors: dict):
+        self.errors = errors
+        super().__init__("; ".join(f"{name}: {e}" for name, e in errors.items()))
+
+
+def run_stages(stages: list, context) -> dict:
+    # Starts each stage in a thread as soon as the stages it comes after are finished.
+    # A failed stage does not stop the others: stages reading its results carry on
+    # without them (they warn about missing results). Stages listed in `after` but
+    # not in `stages` count as done. Returns the errors by stage name.
+    names = {stage.name for stage in stages}
+    pending = list(stages)
+    running = {}
+    done, errors = set(), {}
+    with ThreadPoolExecutor(max_workers=max(len(stages), 1)) as pool:
+        while pending or running:
+            ready = [s for s in pending if all(name in done or name not in names for name in s.after)]
+            for stage in ready:
+                pending.remove(stage)
+                running[pool.submit(stage.run, context)] = stage.name
+            if not running:
+                raise ValueError(f"Stages waiting on each other: {', '.join(s.name for s in pending)}")
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                done.add(name)
+                if future.exception() is not None:
+                    errors[name] = future.exception()
+                    print(f"❌ {name} failed: {errors[name]}")
+    return errors
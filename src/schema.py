@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype
+
+# Typed member tables: one row per member with the two name columns, the
+# subscription quantities and the group. Static "NN-NN" price lines are left out,
+# so the quantity columns can be plain numbers. They are only used to count the
+# subscriptions; the merged sheets are built from their plain form (to_output).
+
+NAME_COLUMNS = 2  # "Nom", "Prénom" come first
+SUBSCRIPTION_COLUMNS = ["legumes", "legumes_3", "oeufs"]
+SMALL_INT = "Int16"
+
+
+def small_ints(col: pd.Series) -> pd.Series:
+    # Nullable small integers when every value is a whole number that fits, else unchanged
+    if col.dtype == bool:
+        return col
+    if not is_numeric_dtype(col):
+        # object columns of parsed numbers, as long as nothing else is in there
+        numeric = pd.to_numeric(col, errors="coerce")
+        if numeric.notna().sum() != col.notna().sum():
+            return col
+        col = numeric
+    values = col.dropna()
+    if len(values) and not (np.isclose(values % 1, 0).all() and values.abs().max() < 2 ** 15):
+        return col
+    return col.astype(SMALL_INT)
+
+
+def member_table(df: pd.DataFrame) -> pd.DataFrame:
+    # Categorical names and group, small nullable ints for the subscriptions
+    typed = {}
+    for i, col in enumerate(df.columns):
+        if i < NAME_COLUMNS or col == "group":
+            typed[col] = df[col].astype("category")
+        elif col in SUBSCRIPTION_COLUMNS:
+            typed[col] = small_ints(df[col])
+        else:
+            typed[col] = df[col]
+    return pd.DataFrame(typed, index=df.index)
+
+
+def member_rows(df: pd.DataFrame, static_mask: pd.Series) -> pd.DataFrame:
+    # The rows left once the static lines are taken out
+    return df[~static_mask].copy()
+
+
+def subscription_counts(members: pd.DataFrame, columns: list) -> dict:
+    # Members taking their share this week (quantity == 1), per column
+    return {col: (members[col] == 1).sum() for col in columns if col in members.columns}
+
+
+def group_counts(members: pd.DataFrame, columns: list) -> dict:
+    # {group: subscription_counts of the group's members}
+    if "group" not in members.columns:
+        return {}
+    return {
+        group: subscription_counts(rows, columns)
+        for group, rows in members.groupby("group", observed=True)
+    }
+
+
+def to_output(members: pd.DataFrame) -> pd.DataFrame:
+    # Back to the plain object/float columns the sheet writers and the pdf expect
+    plain = {}
+    for col in members.columns:
+        values = members[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype(object)
+        elif values.dtype == SMALL_INT:
+            values = values.astype("float64")
+        plain[col] = values
+    return pd.DataFrame(plain, index=members.index)
@@ -0,0 +1,183 @@
+import json
+import sqlite3
+import pandas as pd
+from pathlib import Path
+
+from pipeline import PipelineContext
+
+DB_FILE = "amap_season.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS contract_rows (
+    contract TEXT NOT NULL,  -- 'legumes' or 'oeufs'
+    date TEXT NOT NULL,      -- Saturday, YYYY-MM-DD
+    grp TEXT NOT NULL,
+    row_no INTEGER NOT NULL, -- row order in the cleaned sheet
+    nom TEXT,
+    prenom TEXT,
+    legumes REAL,
+    legumes_3 REAL,
+    oeufs REAL,
+    cells TEXT NOT NULL,     -- the whole cleaned row, as JSON
+    PRIMARY KEY (contract, date, grp, row_no)
+);
+CREATE INDEX IF NOT EXISTS contract_rows_date_grp ON contract_rows (date, grp);
+CREATE INDEX IF NOT EXISTS contract_rows_member ON contract_rows (nom, prenom);
+
+CREATE TABLE IF NOT EXISTS permanences (
+    date TEXT NOT NULL,
+    grp TEXT NOT NULL,
+    task TEXT,
+    row_no INTEGER NOT NULL,
+    nom TEXT,
+    prenom TEXT,
+    cells TEXT NOT NULL,
+    PRIMARY KEY (date, row_no)
+);
+CREATE INDEX IF NOT EXISTS permanences_date_grp ON permanences (date, grp, task);
+CREATE INDEX IF NOT EXISTS permanences_member ON permanences (nom, prenom);
+"""
+
+# Quantity columns stored as numbers, by contract; they are the ones counted in the cumul
+COUNT_COLUMNS = {"legumes": ["legumes", "legumes_3"], "oeufs": ["oeufs"]}
+QUANTITY_COLUMNS = ["legumes", "legumes_3", "oeufs"]
+
+# Member rows are the ones with a name; static/price lines have none
+MEMBER_ROW = "(COALESCE(nom, '') != '' OR COALESCE(prenom, '') != '')"
+
+
+def connect(folder: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(Path(folder) / DB_FILE)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def name_column(df: pd.DataFrame, name: str) -> pd.Series:
+    # First column called `name` (any case), as text, or all None
+    for col in df.columns:
+        if str(col).strip().lower() == name:
+            text = df[col].astype(object)
+            return text.where(text.notna(), None).map(lambda v: v if v is None else str(v).strip())
+    return pd.Series([None] * len(df), index=df.index, dtype=object)
+
+
+def cells_json(df: pd.DataFrame) -> list:
+    values = df.astype(object).where(df.notna(), None)
+    columns = [str(col) for col in df.columns]
+    return [json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=str)
+            for row in values.itertuples(index=False, name=None)]
+
+
+def store_contract(conn: sqlite3.Connection, contract: str, date_str: str, cleaned: dict):
+    # Replaces the week's rows of that contract with the cleaned sheet of every group
+    conn.execute("DELETE FROM contract_rows WHERE contract = ? AND date = ?", (contract, date_str))
+    for group, df in cleaned.items():
+        df = df.reset_index(drop=True)
+        quantities = {
+            col: pd.to_numeric(df[col], errors="coerce").astype(object).where(lambda s: s.notna(), None)
+            if col in df.columns else [None] * len(df)
+            for col in QUANTITY_COLUMNS
+        }
+        conn.executemany(
+            "INSERT INTO contract_rows VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            zip(
+                [contract] * len(df), [date_str] * len(df), [group] * len(df), range(len(df)),
+                name_column(df, "nom"), name_column(df, "prénom"),
+                *(quantities[col] for col in QUANTITY_COLUMNS),
+                cells_json(df),
+            ),
+        )
+
+
+def store_permanences(conn: sqlite3.Connection, date_str: str, df: pd.DataFrame):
+    conn.execute("DELETE FROM permanences WHERE date = ?", (date_str,))
+    if df.empty:
+        return
+    df = df.reset_index(drop=True)
+    task = df["Tâche"].astype(object).where(df["Tâche"].notna(), None) if "Tâche" in df.columns else [None] * len(df)
+    conn.executemany(
+        "INSERT INTO permanences VALUES (?, ?, ?, ?, ?, ?, ?)",
+        zip(
+            [date_str] * len(df), df["group"], task, range(len(df)),
+            name_column(df, "nom"), name_column(df, "prénom"),
+            cells_json(df),
+        ),
+    )
+
+
+def weekly_sheet(conn: sqlite3.Connection, contract: str, date_str: str) -> pd.DataFrame:
+    # The week's cleaned rows of every group, with their group, as the extractors merge them
+    rows = conn.execute(
+        "SELECT grp, cells FROM contract_rows WHERE contract = ? AND date = ? ORDER BY grp, row_no",
+        (contract, date_str),
+    ).fetchall()
+    return pd.DataFrame([{**json.loads(cells), "group": grp} for grp, cells in rows])
+
+
+def cumul_counts(conn: sqlite3.Connection, contract: str, date_str: str) -> dict:
+    # Members who take their share this week, per quantity column (cells equal to 1)
+    columns = COUNT_COLUMNS[contract]
+    sums = ", ".join(f"COALESCE(SUM({col} = 1), 0)" for col in columns)
+    any_one = " OR ".join(f"{col} = 1" for col in columns)
+    counts = conn.execute(
+        f"SELECT {sums} FROM contract_rows"
+        f" WHERE contract = ? AND date = ? AND {MEMBER_ROW} AND ({any_one})",
+        (contract, date_str),
+    ).fetchone()
+    return dict(zip(columns, counts))
+
+
+def oeufs_summary(conn: sqlite3.Connection, date_str: str) -> pd.DataFrame:
+    # Boxes of 6 per group, and how many 30-egg trays ("plaques") that makes
+    return pd.read_sql_query(
+        f"""
+        SELECT grp AS "group", boites, boites * 6 AS oeufs,
+               (boites * 6) / 30 AS plaques, (boites * 6) % 30 AS restant
+        FROM (
+            SELECT grp, CAST(COALESCE(SUM(oeufs), 0) AS INTEGER) AS boites
+            FROM contract_rows
+            WHERE contract = 'oeufs' AND date = ? AND {MEMBER_ROW}
+            GROUP BY grp
+        )
+        ORDER BY grp
+        """,
+        conn, params=(date_str,),
+    )
+
+
+def member_history(conn: sqlite3.Connection, nom: str, prenom: str = None) -> pd.DataFrame:
+    # Every week a member appears in, across contracts
+    query = "SELECT date, contract, grp, legumes, legumes_3, oeufs FROM contract_rows WHERE nom = ?"
+    params = [nom]
+    if prenom is not None:
+        query += " AND prenom = ?"
+        params.append(prenom)
+    return pd.read_sql_query(query + " ORDER BY date, contract", conn, params=params)
+
+
+def run(context: PipelineContext):
+    # Stores the week's cleaned contract rows and permanences (stage results must be present)
+    with connect(context.folder) as conn:
+        for contract in COUNT_COLUMNS:
+            result = context.results.get(contract)
+            if result is not None:
+                store_contract(conn, contract, context.date_str, result.cleaned)
+        result = context.results.get("permanences")
+        if result is not None:
+            store_permanences(conn, context.date_str, result.sheets["merged"].df)
+    conn.close()
+    print(f"✅ Week {context.date_str} stored in {DB_FILE}")
+
+
+def main():
+    # Prints the week's counts from the database
+    context = PipelineContext()
+    with connect(context.folder) as conn:
+        for contract in COUNT_COLUMNS:
+            print(contract, cumul_counts(conn, contract, context.date_str))
+        print(oeufs_summary(conn, context.date_str).to_string(index=False))
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import time
+from pathlib import Path
+
+from discover import FileManifest, scan
+
+
+def changed_keys(before: dict, after: dict) -> set:
+    # Kinds of the files added, removed or modified between two signatures
+    return {
+        (after.get(path) or before.get(path))[0]
+        for path in before.keys() | after.keys()
+        if before.get(path) != after.get(path)
+    }
+
+
+def wait_until_quiet(folder: Path, patterns: dict, snapshot: FileManifest, interval: float,
+                     debounce: float) -> FileManifest:
+    # Files are often copied several at a time: wait until nothing moved for `debounce` seconds
+    last_change = time.monotonic()
+    while time.monotonic() - last_change < debounce:
+        time.sleep(interval)
+        current = scan(folder, patterns)
+        if current.signature() != snapshot.signature():
+            snapshot = current
+            last_change = time.monotonic()
+    return snapshot
+
+
+def watch(folder: Path, patterns: dict, on_change, interval: float = 2.0, debounce: float = 3.0):
+    # Calls on_change(None, inputs) once, then on_change(kinds, inputs) with the kinds of
+    # the files that changed (see discover.FILE_PATTERNS) and the new scan, until interrupted
+    snapshot = scan(folder, patterns)
+    on_change(None, snapshot)
+    while True:
+        time.sleep(interval)
+        current = scan(folder, patterns)
+        if current.signature() == snapshot.signature():
+            continue
+        current = wait_until_quiet(folder, patterns, current, interval, debounce)
+        keys = changed_keys(snapshot.signature(), current.signature())
+        snapshot = current
+        if keys:
+            on_change(keys, current)